@@ -1,5 +1,5 @@
-from core.bittensor_overrides.dendrite import dendrite
+from core.bittensor_overrides.dendrite import dendrite, get_pool_name, RequestPhaseTimer
 from core.bittensor_overrides.axon import axon
 
 
-__all__ = ["dendrite", "axon"]
\ No newline at end of file
+__all__ = ["dendrite", "axon", "get_pool_name", "RequestPhaseTimer"]
\ No newline at end of file
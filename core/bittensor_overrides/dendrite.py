@@ -1,12 +1,329 @@
 import asyncio
 import time
-from typing import Any, AsyncGenerator, List, Union
+from collections import OrderedDict, deque
+from types import SimpleNamespace
+from typing import Any, AsyncGenerator, Deque, Dict, List, NamedTuple, Optional, Tuple, Union
 
 import aiohttp
 import bittensor
+import ujson as json
+
+# OVERRIDE: Separate connection pools, so slow synthetic requests (e.g. 50s avatars) can't hold up
+# organic ones, and long lived streams can't hold up quick unary requests
+POOL_ORGANIC_UNARY = "organic_unary"
+POOL_ORGANIC_STREAM = "organic_stream"
+POOL_SYNTHETIC_UNARY = "synthetic_unary"
+POOL_SYNTHETIC_STREAM = "synthetic_stream"
+
+# pool -> (total connection limit, connection limit per host)
+POOL_CONNECTION_LIMITS: Dict[str, tuple[int, int]] = {
+    POOL_ORGANIC_UNARY: (256, 8),
+    POOL_ORGANIC_STREAM: (256, 8),
+    POOL_SYNTHETIC_UNARY: (512, 16),
+    POOL_SYNTHETIC_STREAM: (256, 8),
+}
+POOL_KEEPALIVE_TIMEOUT = 30
+POOL_DNS_CACHE_TTL = 300
+
+# OVERRIDE: String fields at least this big (base64 images) in synthetic requests only get json encoded once,
+# not once per uid
+LARGE_PAYLOAD_FIELD_MIN_SIZE = 16 * 1024
+MAX_CACHED_PAYLOAD_FIELDS = 32
+SYNTHETIC_POOLS = frozenset({POOL_SYNTHETIC_UNARY, POOL_SYNTHETIC_STREAM})
+
+
+def get_pool_name(synthetic_query: bool, streaming: bool) -> str:
+    if synthetic_query:
+        return POOL_SYNTHETIC_STREAM if streaming else POOL_SYNTHETIC_UNARY
+    return POOL_ORGANIC_STREAM if streaming else POOL_ORGANIC_UNARY
+
+
+class ConnectionWaitStats:
+    """How long requests spend waiting for a free connection in a pool"""
+
+    __slots__ = ("requests", "requests_queued", "total_wait", "max_wait")
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.requests_queued = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "requests": self.requests,
+            "requests_queued": self.requests_queued,
+            "mean_wait": self.total_wait / self.requests if self.requests else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+class RequestPhaseTimer:
+    """
+    Where the time went in a single request, from perf_counter timestamps filled in by the pool's trace
+    config (via aiohttp's trace_request_ctx) and by call / call_stream themselves
+    """
+
+    __slots__ = (
+        "pool_wait",
+        "dns",
+        "connect",
+        "request_started_at",
+        "connection_acquired_at",
+        "request_sent_at",
+        "response_started_at",
+        "body_received_at",
+        "deserialized_at",
+    )
+
+    def __init__(self) -> None:
+        self.pool_wait: Optional[float] = None
+        self.dns: Optional[float] = None
+        self.connect: Optional[float] = None
+        self.request_started_at: Optional[float] = None
+        self.connection_acquired_at: Optional[float] = None
+        self.request_sent_at: Optional[float] = None
+        self.response_started_at: Optional[float] = None
+        self.body_received_at: Optional[float] = None
+        self.deserialized_at: Optional[float] = None
+
+    @staticmethod
+    def _between(start: Optional[float], end: Optional[float]) -> Optional[float]:
+        if start is None or end is None:
+            return None
+        return max(end - start, 0.0)
+
+    def to_dict(self) -> Dict[str, Optional[float]]:
+        return {
+            "pool_wait": self.pool_wait,
+            "dns": self.dns,
+            # The connector's connection creation includes resolving the host
+            "connect": self.connect - (self.dns or 0.0) if self.connect is not None else None,
+            "request_write": self._between(self.connection_acquired_at, self.request_sent_at),
+            "time_to_first_byte": self._between(self.request_sent_at, self.response_started_at),
+            "body_transfer": self._between(self.response_started_at, self.body_received_at),
+            "deserialize": self._between(self.body_received_at, self.deserialized_at),
+            "total": self._between(self.request_started_at, self.deserialized_at or self.body_received_at),
+        }
+
+
+class ResponseRecord(NamedTuple):
+    """What's kept of each request for diagnostics, instead of a whole synapse"""
+
+    timestamp: float
+    axon_hotkey: Optional[str]
+    axon_address: str
+    request_name: str
+    status_code: Optional[int]
+    process_time: float
+    request_bytes: int
+    response_bytes: Optional[int]
+
+
+class EncodedPayloadFieldCache:
+    """
+    Json encodings of large string fields from the synthetic payload pool, keyed on the identity of the string.
+    The synthetic data manager hands the very same string (e.g. an avatar init_image) to every uid
+    in a batch, so it's encoded once, and each request just splices the encoded bytes into its body.
+    Organic payloads are never seen twice, so they're kept out of it.
+    """
+
+    def __init__(self, max_size: int = MAX_CACHED_PAYLOAD_FIELDS) -> None:
+        self.max_size = max_size
+        # Each entry holds on to the string itself, so its id can't be reused by a different string while it's
+        # cached, & hits are checked by identity on top
+        self._entries: OrderedDict[int, Tuple[str, bytes]] = OrderedDict()
+
+    def get_encoded(self, value: str) -> bytes:
+        key = id(value)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is value:
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        encoded = json.dumps(value).encode()
+        self._entries[key] = (value, encoded)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return encoded
 
 
 class dendrite(bittensor.dendrite):
+    def __init__(self, *args, response_history_size: int = 0, **kwargs) -> None:
+        """response_history_size: how many recent ResponseRecords to keep, 0 keeps none"""
+        super().__init__(*args, **kwargs)
+        # OVERRIDE: a small, opt-in ring buffer rather than the ever growing synapse_history
+        self.response_history: Optional[Deque[ResponseRecord]] = (
+            deque(maxlen=response_history_size) if response_history_size > 0 else None
+        )
+        self._pool_sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._connection_wait_stats: Dict[str, ConnectionWaitStats] = {}
+        self._encoded_payload_fields = EncodedPayloadFieldCache()
+
+    def _serialize_body(self, synapse: bittensor.Synapse, pool: str) -> bytes:
+        """
+        synapse.dict() as json. For synthetic requests, any large string fields are taken from the cache rather
+        than encoded again
+        """
+        body = synapse.dict()
+        if pool not in SYNTHETIC_POOLS:
+            return json.dumps(body).encode()
+        large_fields = [
+            (field, value)
+            for field, value in body.items()
+            if isinstance(value, str) and len(value) >= LARGE_PAYLOAD_FIELD_MIN_SIZE
+        ]
+        if not large_fields:
+            return json.dumps(body).encode()
+
+        for field, _ in large_fields:
+            del body[field]
+        # Everything but the closing brace, then the large fields, then close it off again
+        parts = [json.dumps(body).encode()[:-1]]
+        separator = b"," if body else b""
+        for field, value in large_fields:
+            encoded_value = self._encoded_payload_fields.get_encoded(value)
+            parts.append(separator + json.dumps(field).encode() + b":" + encoded_value)
+            separator = b","
+        parts.append(b"}")
+        return b"".join(parts)
+
+    @staticmethod
+    def _get_request_headers(synapse: bittensor.Synapse) -> Dict[str, str]:
+        headers = synapse.to_headers()
+        headers["Content-Type"] = "application/json"
+        return headers
+
+    def _get_pool_session(self, pool: str) -> aiohttp.ClientSession:
+        """One long lived session (and connector) per pool, so connections get reused across requests"""
+        pool_sessions = self._pool_sessions
+        session = pool_sessions.get(pool)
+        if session is None or session.closed:
+            limit, limit_per_host = POOL_CONNECTION_LIMITS[pool]
+            connector = aiohttp.TCPConnector(
+                limit=limit,
+                limit_per_host=limit_per_host,
+                keepalive_timeout=POOL_KEEPALIVE_TIMEOUT,
+                use_dns_cache=True,
+                ttl_dns_cache=POOL_DNS_CACHE_TTL,
+            )
+            session = aiohttp.ClientSession(connector=connector, trace_configs=[self._get_pool_trace_config(pool)])
+            pool_sessions[pool] = session
+        return session
+
+    def _get_pool_trace_config(self, pool: str) -> aiohttp.TraceConfig:
+        stats = self._connection_wait_stats.setdefault(pool, ConnectionWaitStats())
+
+        def get_timer(trace_config_ctx: SimpleNamespace) -> Optional[RequestPhaseTimer]:
+            timer = trace_config_ctx.trace_request_ctx
+            return timer if isinstance(timer, RequestPhaseTimer) else None
+
+        async def on_request_start(session, trace_config_ctx: SimpleNamespace, params) -> None:
+            stats.requests += 1
+            timer = get_timer(trace_config_ctx)
+            if timer is not None:
+                timer.request_started_at = time.perf_counter()
+
+        async def on_connection_queued_start(session, trace_config_ctx: SimpleNamespace, params) -> None:
+            trace_config_ctx.queued_at = time.perf_counter()
+
+        async def on_connection_queued_end(session, trace_config_ctx: SimpleNamespace, params) -> None:
+            wait = time.perf_counter() - trace_config_ctx.queued_at
+            stats.requests_queued += 1
+            stats.total_wait += wait
+            stats.max_wait = max(stats.max_wait, wait)
+            timer = get_timer(trace_config_ctx)
+            if timer is not None:
+                timer.pool_wait = wait
+
+        async def on_dns_resolvehost_start(session, trace_config_ctx: SimpleNamespace, params) -> None:
+            trace_config_ctx.dns_started_at = time.perf_counter()
+
+        async def on_dns_resolvehost_end(session, trace_config_ctx: SimpleNamespace, params) -> None:
+            timer = get_timer(trace_config_ctx)
+            if timer is not None:
+                timer.dns = time.perf_counter() - trace_config_ctx.dns_started_at
+
+        async def on_connection_create_start(session, trace_config_ctx: SimpleNamespace, params) -> None:
+            trace_config_ctx.connect_started_at = time.perf_counter()
+
+        async def on_connection_create_end(session, trace_config_ctx: SimpleNamespace, params) -> None:
+            timer = get_timer(trace_config_ctx)
+            if timer is not None:
+                timer.connection_acquired_at = time.perf_counter()
+                timer.connect = timer.connection_acquired_at - trace_config_ctx.connect_started_at
+
+        async def on_connection_reuseconn(session, trace_config_ctx: SimpleNamespace, params) -> None:
+            timer = get_timer(trace_config_ctx)
+            if timer is not None:
+                timer.connection_acquired_at = time.perf_counter()
+                timer.connect = 0.0
+
+        async def on_request_sent(session, trace_config_ctx: SimpleNamespace, params) -> None:
+            # Headers, then each chunk of the body - whichever comes last is when the request is fully written
+            timer = get_timer(trace_config_ctx)
+            if timer is not None:
+                timer.request_sent_at = time.perf_counter()
+
+        async def on_request_end(session, trace_config_ctx: SimpleNamespace, params) -> None:
+            # Fires once the response status & headers are in
+            timer = get_timer(trace_config_ctx)
+            if timer is not None:
+                timer.response_started_at = time.perf_counter()
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_queued_start.append(on_connection_queued_start)
+        trace_config.on_connection_queued_end.append(on_connection_queued_end)
+        trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+        trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_request_headers_sent.append(on_request_sent)
+        trace_config.on_request_chunk_sent.append(on_request_sent)
+        trace_config.on_request_end.append(on_request_end)
+        return trace_config
+
+    def _record_response(
+        self,
+        synapse: bittensor.Synapse,
+        target_axon: bittensor.AxonInfo,
+        request_name: str,
+        start_time: float,
+        request_bytes: int,
+        response_bytes: Optional[int],
+    ) -> None:
+        if self.response_history is None:
+            return
+        status_code = synapse.dendrite.status_code
+        self.response_history.append(
+            ResponseRecord(
+                timestamp=start_time,
+                axon_hotkey=target_axon.hotkey,
+                axon_address=f"{target_axon.ip}:{target_axon.port}",
+                request_name=request_name,
+                status_code=int(status_code) if status_code is not None else None,
+                process_time=time.time() - start_time,
+                request_bytes=request_bytes,
+                response_bytes=response_bytes,
+            )
+        )
+
+    def get_recent_responses(self, axon_hotkey: Optional[str] = None) -> List[ResponseRecord]:
+        if self.response_history is None:
+            return []
+        return [record for record in self.response_history if axon_hotkey is None or record.axon_hotkey == axon_hotkey]
+
+    def get_connection_pool_metrics(self) -> Dict[str, Dict[str, float]]:
+        return {pool: stats.to_dict() for pool, stats in self._connection_wait_stats.items()}
+
+    async def aclose_session(self) -> None:
+        pool_sessions, self._pool_sessions = self._pool_sessions, {}
+        for session in pool_sessions.values():
+            await session.close()
+        await super().aclose_session()
+
     def _log_outgoing_request(self, synapse: bittensor.synapse) -> None:
         """I don't like their logging, it says success regardless of a success x)"""
         # info = {"headers": synapse.to_headers(), "json": synapse.dict()}
@@ -50,6 +367,8 @@ class dendrite(bittensor.dendrite):
         run_async: bool = True,
         streaming: bool = False,
         log_requests_and_responses: bool = True,
+        pool: Optional[str] = None,
+        request_timer: Optional[RequestPhaseTimer] = None,
     ) -> List[Union[AsyncGenerator[Any, Any], bittensor.Synapse, bittensor.StreamingSynapse]]:
         """
         Asynchronously sends requests to one or multiple Axons and collates their responses.
@@ -78,6 +397,8 @@ class dendrite(bittensor.dendrite):
             deserialize (bool, optional): Determines if the received response should be deserialized. Defaults to True.
             run_async (bool, optional): If True, sends requests concurrently. Otherwise, sends requests sequentially. Defaults to True.
             streaming (bool, optional): Indicates if the response is expected to be in streaming format. Defaults to False.
+            pool (str, optional): Which connection pool to send the requests through. Defaults to the organic pool.
+            request_timer (RequestPhaseTimer, optional): Filled in with per phase timings. Only for a single axon.
 
         Returns:
             Union[AsyncGenerator, bittensor.Synapse, List[bittensor.Synapse]]: If a single Axon is targeted, returns its response.
@@ -96,6 +417,8 @@ class dendrite(bittensor.dendrite):
                 f"Argument streaming is {streaming} while issubclass(synapse, StreamingSynapse) is {synapse.__class__.__name__}. This may cause unexpected behavior."
             )
         streaming = is_streaming_subclass or streaming
+        if pool is None:
+            pool = get_pool_name(synthetic_query=False, streaming=streaming)
 
         async def query_all_axons(
             is_stream: bool,
@@ -131,6 +454,8 @@ class dendrite(bittensor.dendrite):
                         response_timeout=response_timeout,
                         deserialize=deserialize,
                         log_requests_and_responses=log_requests_and_responses,
+                        pool=pool,
+                        request_timer=request_timer,
                     )
                 else:
                     # If not in streaming mode, simply call the axon and get the response.
@@ -141,6 +466,8 @@ class dendrite(bittensor.dendrite):
                         response_timeout=response_timeout,
                         deserialize=deserialize,
                         log_requests_and_responses=log_requests_and_responses,
+                        pool=pool,
+                        request_timer=request_timer,
                     )
 
             # If run_async flag is False, get responses one by one.
@@ -165,6 +492,8 @@ class dendrite(bittensor.dendrite):
         response_timeout: float = 3.0,
         deserialize: bool = True,
         log_requests_and_responses: bool = True,
+        pool: str = POOL_ORGANIC_STREAM,
+        request_timer: Optional[RequestPhaseTimer] = None,
     ) -> AsyncGenerator[Any, Any]:
         """
         Sends a request to a specified Axon and yields streaming responses.
@@ -197,6 +526,8 @@ class dendrite(bittensor.dendrite):
         synapse = self.preprocess_synapse_for_request(target_axon, synapse, response_timeout)
 
         timeout_settings = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=response_timeout)
+        body = b""
+        response_bytes = None
 
         try:
             # Log outgoing request
@@ -204,15 +535,20 @@ class dendrite(bittensor.dendrite):
                 self._log_outgoing_request(synapse)
 
             # Make the HTTP POST request
-            async with (await self.session).post(
+            body = self._serialize_body(synapse, pool)
+            async with self._get_pool_session(pool).post(
                 url,
-                headers=synapse.to_headers(),
-                json=synapse.dict(),
+                headers=self._get_request_headers(synapse),
+                data=body,
                 timeout=timeout_settings,
+                trace_request_ctx=request_timer,
             ) as response:
+                response_bytes = response.content_length
                 # Use synapse subclass' process_streaming_response method to yield the response chunks
                 async for chunk in synapse.process_streaming_response(response):
                     yield chunk
+                if request_timer is not None:
+                    request_timer.body_received_at = time.perf_counter()
 
                 # OVERRIDE: DISABLE THIS AS I ALSO HAVE NO IDEA WHY WE EVEN NEED IT
                 # json_response = synapse.extract_response_json(response)
@@ -234,6 +570,8 @@ class dendrite(bittensor.dendrite):
             if log_requests_and_responses:
                 self._log_incoming_response(synapse)
 
+            self._record_response(synapse, target_axon, request_name, start_time, len(body), response_bytes)
+
             # OVERRIDE: DISABLE THIS AS IT SEEMS LIKE ITS NEVER USED
             # Log synapse event history
             # self.synapse_history.append(bittensor.Synapse.from_headers(synapse.to_headers()))
@@ -252,6 +590,8 @@ class dendrite(bittensor.dendrite):
         response_timeout: float = 3.0,
         deserialize: bool = True,
         log_requests_and_responses: bool = True,
+        pool: str = POOL_ORGANIC_UNARY,
+        request_timer: Optional[RequestPhaseTimer] = None,
     ) -> bittensor.Synapse | Any:
         """
         Asynchronously sends a request to a specified Axon and processes the response.
@@ -282,6 +622,8 @@ class dendrite(bittensor.dendrite):
         synapse = self.preprocess_synapse_for_request(target_axon, synapse, response_timeout)
 
         timeout_settings = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=response_timeout)
+        body = b""
+        response_bytes = None
 
         try:
             # Log outgoing request
@@ -289,12 +631,18 @@ class dendrite(bittensor.dendrite):
                 self._log_outgoing_request(synapse)
 
             # Make the HTTP POST request
-            async with (await self.session).post(
+            body = self._serialize_body(synapse, pool)
+            async with self._get_pool_session(pool).post(
                 url,
-                headers=synapse.to_headers(),
-                json=synapse.dict(),
+                headers=self._get_request_headers(synapse),
+                data=body,
                 timeout=timeout_settings,
+                trace_request_ctx=request_timer,
             ) as response:
+                response_bytes = response.content_length
+                await response.read()
+                if request_timer is not None:
+                    request_timer.body_received_at = time.perf_counter()
                 # Extract the JSON response from the server
                 json_response = await response.json()
                 # Process the server response and fill synapse
@@ -310,14 +658,15 @@ class dendrite(bittensor.dendrite):
             if log_requests_and_responses:
                 self._log_incoming_response(synapse)
 
-            # Log synapse event history
-            self.synapse_history.append(bittensor.Synapse.from_headers(synapse.to_headers()))
+            # OVERRIDE: no more synapse_history - it grew forever, and round tripping the headers isn't free
+            self._record_response(synapse, target_axon, request_name, start_time, len(body), response_bytes)
 
-            # Return the updated synapse object after deserializing if requested
-            if deserialize:
-                return synapse.deserialize()  # noqa: B012
-            else:
-                return synapse
+        # OVERRIDE: return outside of the finally, so a cancelled request (e.g. a losing hedge) stays cancelled
+        # Return the updated synapse object after deserializing if requested
+        result = synapse.deserialize() if deserialize else synapse
+        if request_timer is not None and request_timer.body_received_at is not None:
+            request_timer.deserialized_at = time.perf_counter()
+        return result
 
     def _handle_request_errors(
         self,
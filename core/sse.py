@@ -0,0 +1,62 @@
+"""
+Incremental server sent events framing, for streams where a network read can end anywhere - mid event,
+or mid multi-byte character.
+"""
+
+from typing import List, Tuple
+
+EVENT_SEPARATOR = b"\n\n"
+CRLF_EVENT_SEPARATOR = b"\r\n\r\n"
+
+
+class SSEParser:
+    """
+    Feed it chunks as they arrive, get back only complete events (without the separator).
+    Partial events are kept until the rest turns up, and nothing is ever scanned twice, so it's linear
+    over the whole stream. Splitting on the separator at the byte level can't split a utf-8 character.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self._search_from = 0
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        buffer = self._buffer
+        buffer += chunk
+
+        events = []
+        start = 0
+        search_from = self._search_from
+        while True:
+            end, separator_length = self._find_separator(buffer, search_from)
+            if end == -1:
+                break
+            if end > start:
+                events.append(bytes(buffer[start:end]))
+            start = end + separator_length
+            search_from = start
+
+        if start:
+            del buffer[:start]
+        # The separator might straddle this chunk & the next one
+        self._search_from = max(len(buffer) - len(CRLF_EVENT_SEPARATOR) + 1, 0)
+        return events
+
+    @staticmethod
+    def _find_separator(buffer: bytearray, search_from: int) -> Tuple[int, int]:
+        """The first blank line, whether the miner ends its lines with \\n or \\r\\n"""
+        end = buffer.find(EVENT_SEPARATOR, search_from)
+        # Only as far as the blank line we found, so plain \n streams are never rescanned to the end for every event
+        crlf_end = buffer.find(
+            CRLF_EVENT_SEPARATOR, search_from, len(buffer) if end == -1 else end + len(CRLF_EVENT_SEPARATOR)
+        )
+        if crlf_end != -1 and (end == -1 or crlf_end < end):
+            return crlf_end, len(CRLF_EVENT_SEPARATOR)
+        return end, len(EVENT_SEPARATOR)
+
+    def flush(self) -> bytes:
+        """Whatever's left once the stream is done - a final unterminated event, or a body that was never sse"""
+        leftover = bytes(self._buffer)
+        self._buffer.clear()
+        self._search_from = 0
+        return leftover
@@ -0,0 +1,10 @@
+-- migrate:up
+
+CREATE TABLE usage_ledger_batches (
+    batch_id TEXT PRIMARY KEY,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- migrate:down
+
+DROP TABLE usage_ledger_batches;
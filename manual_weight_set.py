@@ -11,14 +11,14 @@ Usage:
 python manually_set_weights.py --env_file {youvr_vali_hotkey_env_file_here}
 """
 
-from validation.core_validator import core_validator
+from validation.core_validator import get_core_validator
 from validation.weight_setting import calculations
 import asyncio
-from validation.db.db_management import db_manager
 
 async def main():
+    core_validator = get_core_validator()
+    await core_validator.initialize()
     await core_validator.resync_metagraph()
-    await db_manager.initialize()
     total_scores = await calculations.calculate_scores_for_settings_weights(
 
         capacities_for_tasks=core_validator.capacities_for_tasks,
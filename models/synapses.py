@@ -54,11 +54,12 @@ class Chat(bt.StreamingSynapse, base_models.ChatBase):
     def deserialize(self) -> Optional[Dict[str, str]]:
         return None
 
-    async def process_streaming_response(self, response: StreamingResponse) -> AsyncIterator[str]:
+    async def process_streaming_response(self, response: StreamingResponse) -> AsyncIterator[bytes]:
+        # Raw bytes, straight to the byte level sse parser - it only ever splits on the event separator,
+        # so a read that ends half way through a multi-byte character is fine
         async for chunk in response.content.iter_any():
-            if isinstance(chunk, bytes):
-                tokens = chunk.decode("utf-8")
-                yield tokens
+            if isinstance(chunk, bytes) and chunk:
+                yield chunk
 
     def extract_response_json(self, response) -> dict:
         """
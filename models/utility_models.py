@@ -16,6 +16,19 @@ class SCBaseModel(BaseModel):
     def get_schema(cls):
         return cls.schema()
     
+class RequestTimings(SCBaseModel):
+    """Seconds spent in each phase of a request to a miner"""
+
+    pool_wait: Optional[float] = None
+    dns: Optional[float] = None
+    connect: Optional[float] = None
+    request_write: Optional[float] = None
+    time_to_first_byte: Optional[float] = None
+    body_transfer: Optional[float] = None
+    deserialize: Optional[float] = None
+    total: Optional[float] = None
+
+
 class QueryResult(SCBaseModel):
     formatted_response: Any
     axon_uid: Optional[int]
@@ -26,6 +39,8 @@ class QueryResult(SCBaseModel):
     task: Task
     status_code: Optional[int]
     success: bool
+    time_to_first_token: Optional[float] = None
+    timings: Optional[RequestTimings] = None
 
 
 class ChatModels(str, enum.Enum):
@@ -0,0 +1,56 @@
+from core.sse import SSEParser
+
+
+def _feed_all(parser: SSEParser, chunks) -> list:
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events
+
+
+def test_event_split_mid_payload():
+    parser = SSEParser()
+    assert parser.feed(b'data: {"text": "hel') == []
+    assert parser.feed(b'lo"}\n\ndata: {"text"') == [b'data: {"text": "hello"}']
+    assert parser.feed(b': "!"}\n\n') == [b'data: {"text": "!"}']
+    assert parser.flush() == b""
+
+
+def test_separator_split_across_chunks():
+    parser = SSEParser()
+    assert parser.feed(b"data: a\n") == []
+    assert parser.feed(b"\ndata: b\n") == [b"data: a"]
+    assert parser.feed(b"\n") == [b"data: b"]
+
+
+def test_multi_byte_character_split_across_chunks():
+    encoded = 'data: {"text": "café 🚀"}\n\n'.encode()
+    split_at = encoded.index("🚀".encode()) + 2
+
+    events = _feed_all(SSEParser(), [encoded[:split_at], encoded[split_at:]])
+
+    assert [event.decode() for event in events] == ['data: {"text": "café 🚀"}']
+
+
+def test_crlf_line_endings():
+    chunks = [b"data: a\r\n\r", b"\ndata: b\r\n", b"\r\ndata: c\n\n"]
+
+    assert _feed_all(SSEParser(), chunks) == [b"data: a", b"data: b", b"data: c"]
+
+
+def test_byte_at_a_time():
+    stream = b"data: a\n\ndata: b\r\n\r\ndata: c"
+    parser = SSEParser()
+
+    events = _feed_all(parser, [stream[i : i + 1] for i in range(len(stream))])
+
+    assert events == [b"data: a", b"data: b"]
+    assert parser.flush() == b"data: c"
+
+
+def test_flush_returns_trailing_partial_event():
+    parser = SSEParser()
+    assert parser.feed(b'data: a\n\n{"message": "bro') == [b"data: a"]
+    assert parser.flush() == b'{"message": "bro'
+    assert parser.flush() == b""
+    assert parser.feed(b"data: b\n\n") == [b"data: b"]
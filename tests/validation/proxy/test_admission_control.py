@@ -0,0 +1,55 @@
+import asyncio
+
+from core import Task
+from validation.proxy.admission_control import AdmissionController
+from validation.proxy.utils import constants as cst
+
+TASK = Task.chat_llama_3_1_8b
+
+
+async def _fill_to_limit(controller: AdmissionController) -> None:
+    for _ in range(cst.MIN_ORGANIC_IN_FLIGHT_PER_TASK):
+        await controller.acquire(TASK)
+
+
+def test_waiter_gets_slot_on_release():
+    async def run() -> None:
+        controller = AdmissionController(lambda: {})
+        await _fill_to_limit(controller)
+
+        waiter = asyncio.create_task(controller.acquire(TASK))
+        await asyncio.sleep(0)
+        controller.release(TASK)
+        await waiter
+
+        assert controller.get_in_flight(TASK) == cst.MIN_ORGANIC_IN_FLIGHT_PER_TASK
+
+    asyncio.run(run())
+
+
+def test_slot_not_leaked_when_cancelled_after_handoff(monkeypatch):
+    async def wait_without_timeout(future, timeout):
+        # Newer pythons' wait_for raise the cancel even if the result is already in, so
+        # behave like that everywhere
+        return await future
+
+    monkeypatch.setattr(asyncio, "wait_for", wait_without_timeout)
+
+    async def run() -> None:
+        controller = AdmissionController(lambda: {})
+        await _fill_to_limit(controller)
+
+        waiter = asyncio.create_task(controller.acquire(TASK))
+        await asyncio.sleep(0)
+        # Hands the slot over, then the client goes away before the waiter gets to run
+        controller.release(TASK)
+        waiter.cancel()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            pass
+
+        assert controller.get_in_flight(TASK) == cst.MIN_ORGANIC_IN_FLIGHT_PER_TASK - 1
+        assert controller.get_stats()[TASK][1] == 0
+
+    asyncio.run(run())
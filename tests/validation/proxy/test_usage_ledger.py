@@ -0,0 +1,90 @@
+import asyncio
+import glob
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from validation.proxy import sql
+from validation.proxy.usage_ledger import UsageLedger
+
+API_KEY = "test-key"
+STARTING_BALANCE = 100.0
+REPO_ROOT = Path(__file__).parents[3]
+
+# Records one request & flushes it, dying straight after the journal is renamed into a batch (before the db has it),
+# or straight after the batch is committed (before the batch file is removed)
+_CRASHING_RUN = """
+import asyncio, os, sys
+from validation.proxy import sql
+from validation.proxy.usage_ledger import UsageLedger
+
+database_path, journal_path, crash_point = sys.argv[1:]
+sql.DATABASE_PATH = database_path
+apply_usage_batch = sql.apply_usage_batch
+
+
+async def apply_then_die(*args):
+    if crash_point == "after_apply":
+        await apply_usage_batch(*args)
+    os._exit(1)
+
+
+sql.apply_usage_batch = apply_then_die
+
+
+async def main():
+    ledger = UsageLedger(journal_path=journal_path)
+    await ledger.initialize()
+    ledger.record({sql.KEY: "test-key", sql.BALANCE: 100.0}, "/text-to-image", 1.0)
+    await ledger.flush()
+
+
+asyncio.run(main())
+"""
+
+
+def _create_database(path: str) -> None:
+    conn = sqlite3.connect(path)
+    for migration in sorted((REPO_ROOT / "db" / "migrations").glob("*.sql")):
+        with open(migration) as f:
+            conn.executescript(f.read().split("-- migrate:up")[1].split("-- migrate:down")[0])
+    conn.execute(
+        f"INSERT INTO {sql.API_KEYS_TABLE} ({sql.KEY}, {sql.BALANCE}) VALUES (?, ?)", (API_KEY, STARTING_BALANCE)
+    )
+    conn.commit()
+    conn.close()
+
+
+def _get_balance_and_logs(path: str):
+    conn = sqlite3.connect(path)
+    balance_query = f"SELECT {sql.BALANCE} FROM {sql.API_KEYS_TABLE} WHERE {sql.KEY} = ?"
+    balance = conn.execute(balance_query, (API_KEY,)).fetchone()[0]
+    logs = conn.execute(f"SELECT COUNT(*) FROM {sql.LOGS_TABLE}").fetchone()[0]
+    conn.close()
+    return balance, logs
+
+
+@pytest.mark.parametrize("crash_point", ["before_apply", "after_apply"])
+def test_batch_applied_exactly_once_after_a_crash(tmp_path, monkeypatch, crash_point):
+    database_path = str(tmp_path / "vision_database.db")
+    journal_path = str(tmp_path / "usage_ledger.journal")
+    _create_database(database_path)
+
+    crashed_run = subprocess.run(
+        [sys.executable, "-c", _CRASHING_RUN, database_path, journal_path, crash_point], cwd=REPO_ROOT
+    )
+    assert crashed_run.returncode == 1
+    assert len(glob.glob(f"{journal_path}.*.batch")) == 1
+
+    monkeypatch.setattr(sql, "DATABASE_PATH", database_path)
+    # Restart twice, to check the replay doesn't apply anything twice either
+    for _ in range(2):
+        ledger = UsageLedger(journal_path=journal_path)
+        asyncio.run(ledger.initialize())
+        assert not ledger.pending_debits
+
+    assert _get_balance_and_logs(database_path) == (STARTING_BALANCE - 1.0, 1)
+    assert glob.glob(f"{journal_path}.*.batch") == []
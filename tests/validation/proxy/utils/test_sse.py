@@ -0,0 +1,47 @@
+import json
+
+from validation.proxy.utils import sse
+
+
+def test_extracts_plain_text_field():
+    assert sse.extract_json_string_field(b'{"text": "hello", "logprob": -0.1}') == b'"hello"'
+
+
+def test_extracts_field_with_escaped_quote():
+    data = json.dumps({"text": 'say "hi"', "logprob": -0.1}).encode()
+
+    literal = sse.extract_json_string_field(data)
+
+    assert literal == b'"say \\"hi\\""'
+    assert json.loads(literal) == 'say "hi"'
+
+
+def test_extracts_field_ending_in_escaped_backslash():
+    data = json.dumps({"text": "C:\\", "logprob": -0.1}).encode()
+
+    literal = sse.extract_json_string_field(data)
+
+    assert literal == b'"C:\\\\"'
+    assert json.loads(literal) == "C:\\"
+
+
+def test_extracted_field_is_spliced_into_valid_json():
+    data = json.dumps({"text": 'a \\ "b" \u00e9', "logprob": -0.1}, ensure_ascii=False).encode()
+
+    event = sse.format_delta_event(sse.extract_json_string_field(data), first_message=True)
+
+    assert event.endswith(b"\n\n")
+    loaded = json.loads(sse.get_event_data(event))
+    assert loaded["choices"][0]["delta"] == {"content": 'a \\ "b" \u00e9', "role": "assistant"}
+
+
+def test_missing_or_unterminated_field():
+    assert sse.extract_json_string_field(b'{"logprob": -0.1}') is None
+    assert sse.extract_json_string_field(b'{"text": 5}') is None
+    assert sse.extract_json_string_field(b'{"text": "unterminated \\"') is None
+
+
+def test_get_event_data():
+    assert sse.get_event_data(b'data: {"text": "a"}\r') == b'{"text": "a"}'
+    assert sse.get_event_data(b"data: [DONE]") == sse.DONE
+    assert sse.get_event_data(b'{"message": "no"}') is None
@@ -0,0 +1,125 @@
+"""
+Fetches (and caches) the capacities miners advertise for each task.
+
+Only uids that are new, whose axon or hotkey changed, or whose last capacity is stale get queried, with bounded
+concurrency. Responses are stored as they come in, and the refresh stops waiting after a deadline, so a handful
+of slow axons can't hold up the start of a period - they land in the cache for next time.
+"""
+
+import asyncio
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+import bittensor as bt
+
+from core import Task, constants as core_cst
+from models import base_models, synapses, utility_models
+from validation.models import axon_uid
+from validation.proxy.utils import constants as cst, query_utils
+
+
+class _CachedCapacity:
+    __slots__ = ("hotkey", "ip", "port", "capacities", "fetched_at")
+
+    def __init__(self, uid_info: utility_models.UIDinfo, capacities: Dict[Task, float]) -> None:
+        self.hotkey = uid_info.hotkey
+        self.ip = uid_info.axon.ip
+        self.port = uid_info.axon.port
+        self.capacities = capacities
+        self.fetched_at = time.time()
+
+
+class CapacityService:
+    def __init__(
+        self,
+        dendrite: bt.dendrite,
+        max_concurrency: int = cst.CAPACITY_FETCH_CONCURRENCY,
+        max_age: float = cst.CAPACITY_CACHE_MAX_AGE_SECONDS,
+        deadline: float = cst.CAPACITY_FETCH_DEADLINE_SECONDS,
+    ) -> None:
+        self.dendrite = dendrite
+        # Capacities older than a scoring period would hand out volume the miner may no longer have
+        self.max_age = min(max_age, core_cst.SCORING_PERIOD_TIME)
+        self.deadline = deadline
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._cache: Dict[axon_uid, _CachedCapacity] = {}
+        self._in_flight: Dict[axon_uid, asyncio.Task] = {}
+
+    def _needs_refresh(self, uid: axon_uid, uid_info: utility_models.UIDinfo) -> bool:
+        entry = self._cache.get(uid)
+        return (
+            entry is None
+            or entry.hotkey != uid_info.hotkey
+            or entry.ip != uid_info.axon.ip
+            or entry.port != uid_info.axon.port
+            or time.time() - entry.fetched_at > self.max_age
+        )
+
+    async def _fetch(self, uid: axon_uid, uid_info: utility_models.UIDinfo) -> None:
+        async with self._semaphore:
+            capacities, _ = await query_utils.query_individual_axon(
+                synapse=synapses.Capacity(),
+                dendrite=self.dendrite,
+                axon=uid_info.axon,
+                axon_uid=uid,
+                deserialize=True,
+                log_requests_and_responses=False,
+                synthetic_query=True,
+            )
+        self._store(uid, uid_info, capacities)
+
+    def _store(
+        self,
+        uid: axon_uid,
+        uid_info: utility_models.UIDinfo,
+        capacities: Optional[Dict[Task, base_models.VolumeForTask]],
+    ) -> None:
+        if capacities is None:
+            # Nothing to cache, so it gets another go next refresh
+            self._cache.pop(uid, None)
+            return
+
+        allowed_tasks = set([task for task in Task])
+        # This is to stop people claiming tasks that don't exist
+        self._cache[uid] = _CachedCapacity(
+            uid_info,
+            {task: float(volume.volume) for task, volume in capacities.items() if task in allowed_tasks},
+        )
+
+    def _start_fetch(self, uid: axon_uid, uid_info: utility_models.UIDinfo) -> asyncio.Task:
+        task = self._in_flight.get(uid)
+        if task is None:
+            task = asyncio.create_task(self._fetch(uid, uid_info))
+            self._in_flight[uid] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(uid, None))
+        return task
+
+    async def refresh(
+        self, uid_to_uid_info: Dict[axon_uid, utility_models.UIDinfo]
+    ) -> Dict[Task, Dict[axon_uid, float]]:
+        """Returns a fresh task -> uid -> capacity mapping for the given uids"""
+        for uid in list(self._cache.keys()):
+            if uid not in uid_to_uid_info:
+                del self._cache[uid]
+
+        fetches = [
+            self._start_fetch(uid, uid_info)
+            for uid, uid_info in uid_to_uid_info.items()
+            if self._needs_refresh(uid, uid_info)
+        ]
+        bt.logging.info(f"Fetching capacities for {len(fetches)} of {len(uid_to_uid_info)} axons, the rest are cached")
+
+        if fetches:
+            _, pending = await asyncio.wait(fetches, timeout=self.deadline)
+            if pending:
+                bt.logging.info(f"{len(pending)} axons still haven't sent their capacities, carrying on without them")
+
+        capacities_for_tasks: Dict[Task, Dict[axon_uid, float]] = defaultdict(lambda: {})
+        for uid in uid_to_uid_info:
+            entry = self._cache.get(uid)
+            if entry is None:
+                continue
+            for task, volume in entry.capacities.items():
+                capacities_for_tasks[task][uid] = volume
+        return capacities_for_tasks
@@ -2,7 +2,7 @@ import asyncio
 import re
 import threading
 from collections import defaultdict, deque
-from typing import Dict, Tuple
+from typing import Dict
 from typing import List
 from typing import Optional
 from typing import Set
@@ -14,15 +14,20 @@ from core import Task
 from core import TASK_TO_MAX_CAPACITY
 import bittensor as bt
 from validation.synthetic_data.synthetic_generations import SyntheticDataManager
-from validation.proxy.utils import query_utils
+from validation.proxy.utils import constants as cst
 from core import bittensor_overrides as bto
 from config import configuration
 from config.validator_config import config as validator_config
-from models import base_models, synapses, utility_models
+from models import utility_models
 from validation.proxy import validation_utils
+from validation.proxy.admission_control import AdmissionController, AdmissionRejected
 
 from validation.scoring.main import Scorer
-from validation.uid_manager import UidManager
+from validation.uid_manager import ScoringPeriod, UidManager
+from validation.models import UIDRecord
+from validation.capacity_service import CapacityService
+from validation.synthetic_budget import SyntheticBudget
+from validation import metagraph_snapshot, period_checkpoint
 from validation.weight_setting.main import WeightSetter
 from validation.db import post_stats
 from validation.db.db_management import db_manager
@@ -74,12 +79,10 @@ def _connect_to_external_server(hotkey_name: str, external_server_url: str) -> s
 
 class CoreValidator:
     def __init__(self) -> None:
+        """Cheap, and touches no network - all of that happens in initialize()"""
         self.config = self.prepare_config_and_logging()
-        self.subtensor = bt.subtensor(config=self.config)
         self.wallet = bt.wallet(config=self.config)
         self.keypair = self.wallet.hotkey
-        self.dendrite = bto.dendrite(wallet=self.wallet)
-        self.metagraph: bt.metagraph = self.subtensor.metagraph(netuid=self.config.netuid, lite=True)
         self.netuid: int = self.config.netuid if self.config.netuid is not None else 19
         self.task_weights = self._get_task_weights()
 
@@ -87,14 +90,18 @@ class CoreValidator:
 
         self.public_hotkey_address = self.keypair.ss58_address
 
-        _my_stake = self.metagraph.S[self.metagraph.hotkeys.index(self.public_hotkey_address)]
-        self.validator_uid = self.metagraph.hotkeys.index(self.public_hotkey_address)
-        self._my_prop_of_stake = (_my_stake / sum(self.metagraph.S)).item()
+        # Set in initialize()
+        self.subtensor: Optional[bt.subtensor] = None
+        self.dendrite: Optional[bto.dendrite] = None
+        self.metagraph: Optional[bt.metagraph] = None
+        self.validator_uid: Optional[int] = None
+        self._my_prop_of_stake = 1.0
+        self.weight_setter: Optional[WeightSetter] = None
+        self.synthetic_data_manager: Optional[SyntheticDataManager] = None
+        self.capacity_service: Optional[CapacityService] = None
 
-        if self.is_testnet:
-            self._my_prop_of_stake = 1.0
-
-        _connect_to_external_server(validator_config.hotkey_name, validator_config.external_server_url)
+        self._boot_snapshot: Optional[metagraph_snapshot.MetagraphSnapshot] = None
+        self._background_metagraph_sync: Optional[asyncio.Task] = None
 
         # Make the above class variables instead
 
@@ -118,9 +125,54 @@ class CoreValidator:
         self.results_store: Dict[str, utility_models.QueryResult] = {}
 
         self.scorer = Scorer(validator_hotkey=self.keypair.ss58_address, testnet=self.is_testnet, keypair=self.keypair)
+        self.uid_manager = None
+        self.admission_controller = AdmissionController(lambda: self.capacities_for_tasks)
+        self.synthetic_budget = SyntheticBudget(self.admission_controller.get_in_flight)
+
+    async def initialize(self) -> None:
+        """Connects to everything we need. Phases that don't depend on each other run in parallel"""
+        await asyncio.gather(
+            self._connect_to_chain(),
+            asyncio.to_thread(
+                _connect_to_external_server, validator_config.hotkey_name, validator_config.external_server_url
+            ),
+            db_manager.initialize(),
+            self._create_dendrite(),
+        )
+
         self.weight_setter = WeightSetter(subtensor=self.subtensor, config=self.config)
+        self.capacity_service = CapacityService(self.dendrite)
         self.synthetic_data_manager = SyntheticDataManager(self.validator_uid)
-        self.uid_manager = None
+        self.synthetic_data_manager.start()
+
+    async def _create_dendrite(self) -> None:
+        # Looks up our external ip, so off the event loop
+        self.dendrite = await asyncio.to_thread(
+            bto.dendrite, wallet=self.wallet, response_history_size=cst.DENDRITE_RESPONSE_HISTORY_SIZE
+        )
+
+    async def _connect_to_chain(self) -> None:
+        self.subtensor = await asyncio.to_thread(bt.subtensor, config=self.config)
+
+        # A snapshot from the last run lets us start straight away - the chain sync catches up in the background
+        self._boot_snapshot = metagraph_snapshot.load(cst.METAGRAPH_SNAPSHOT_PATH, self.netuid)
+        if self._boot_snapshot is not None and self._boot_snapshot.get_uid(self.public_hotkey_address) is None:
+            self._boot_snapshot = None
+
+        if self._boot_snapshot is not None:
+            bt.logging.info("Loaded the metagraph from the local snapshot, will sync with the chain in the background")
+            self.metagraph = bt.metagraph(netuid=self.netuid, network=self.subtensor.network, lite=True, sync=False)
+            self.validator_uid = self._boot_snapshot.get_uid(self.public_hotkey_address)
+            _my_stake = self._boot_snapshot.get_stake(self.public_hotkey_address)
+            self._my_prop_of_stake = _my_stake / self._boot_snapshot.get_total_stake()
+        else:
+            self.metagraph = await asyncio.to_thread(self.subtensor.metagraph, netuid=self.config.netuid, lite=True)
+            _my_stake = self.metagraph.S[self.metagraph.hotkeys.index(self.public_hotkey_address)]
+            self.validator_uid = self.metagraph.hotkeys.index(self.public_hotkey_address)
+            self._my_prop_of_stake = (_my_stake / sum(self.metagraph.S)).item()
+
+        if self.is_testnet:
+            self._my_prop_of_stake = 1.0
 
     def _get_task_weights(self) -> Dict[Task, float]:
         weights = {
@@ -143,27 +195,27 @@ class CoreValidator:
         db_manager.task_weights = weights
         return weights
 
-    async def _post_and_correct_capacities(self) -> None:
-        self._correct_for_max_capacities()
-        await self._post_miner_capacities_to_tauvision()
-        self._correct_capacities_for_my_stake()
+    async def _post_and_correct_capacities(self, capacities_for_tasks: Dict[Task, Dict[int, float]]) -> None:
+        self._correct_for_max_capacities(capacities_for_tasks)
+        await self._post_miner_capacities_to_tauvision(capacities_for_tasks)
+        self._correct_capacities_for_my_stake(capacities_for_tasks)
 
-    def _correct_capacities_for_my_stake(self) -> None:
+    def _correct_capacities_for_my_stake(self, capacities_for_tasks: Dict[Task, Dict[int, float]]) -> None:
         my_proportion_of_stake = self._my_prop_of_stake
 
         for task in Task:
-            capacities = self.capacities_for_tasks[task]
+            capacities = capacities_for_tasks[task]
             for uid, capacities_for_uid in capacities.items():
                 capacities[uid] = capacities_for_uid * my_proportion_of_stake
 
-    def _correct_for_max_capacities(self) -> None:
+    def _correct_for_max_capacities(self, capacities_for_tasks: Dict[Task, Dict[int, float]]) -> None:
         for task in Task:
-            capacities = self.capacities_for_tasks[task]
+            capacities = capacities_for_tasks[task]
             max_capacity = TASK_TO_MAX_CAPACITY[task]
             for uid, capacity in capacities.items():
                 if capacity < 1:
-                    self.capacities_for_tasks[task][uid] = 0
-                self.capacities_for_tasks[task][uid] = min(capacity, max_capacity)
+                    capacities_for_tasks[task][uid] = 0
+                capacities_for_tasks[task][uid] = min(capacity, max_capacity)
 
     def prepare_config_and_logging(self) -> bt.config:
         base_config = configuration.get_validator_cli_config()
@@ -176,44 +228,13 @@ class CoreValidator:
         self.score_task.add_done_callback(validation_utils.log_task_exception)
 
     async def fetch_available_capacities_for_each_axon(self) -> None:
-        uid_to_query_task = {}
-
-        for uid in self.uid_to_uid_info.keys():
-            task = asyncio.create_task(
-                query_utils.query_individual_axon(
-                    synapse=synapses.Capacity(),
-                    dendrite=self.dendrite,
-                    axon=self.uid_to_uid_info[uid].axon,
-                    axon_uid=uid,
-                    deserialize=True,
-                    log_requests_and_responses=False,
-                )
-            )
-
-            uid_to_query_task[uid] = task
+        capacities_for_tasks = await self.capacity_service.refresh(self.uid_to_uid_info)
+        bt.logging.info(f"Got capacities for {len(set().union(*capacities_for_tasks.values()))} axons!")
 
-        responses_and_response_times: List[
-            Tuple[Optional[Dict[Task, base_models.VolumeForTask]], float]
-        ] = await asyncio.gather(*uid_to_query_task.values())
-
-        uids = uid_to_query_task.keys()
-        all_capacities = [i[0] for i in responses_and_response_times]
-
-        bt.logging.info(f"Got capacities from {len([i for i in all_capacities if i is not None])} axons!")
+        # Everything's worked out on the side, so the lock is only held for the swap
+        await self._post_and_correct_capacities(capacities_for_tasks)
         with self.threading_lock:
-            self.capacities_for_tasks = defaultdict(lambda: {})
-            for uid, capacities in zip(uids, all_capacities):
-                if capacities is None:
-                    continue
-
-                allowed_tasks = set([task for task in Task])
-                for task, volume in capacities.items():
-                    # This is to stop people claiming tasks that don't exist
-                    if task not in allowed_tasks:
-                        continue
-                    if uid not in self.capacities_for_tasks[task]:
-                        self.capacities_for_tasks[task][uid] = float(volume.volume)
-            await self._post_and_correct_capacities()
+            self.capacities_for_tasks = capacities_for_tasks
 
         bt.logging.info("Done fetching available tasks!")
 
@@ -222,37 +243,57 @@ class CoreValidator:
         Resyncs the metagraph and updates the hotkeys and moving averages based on the new metagraph.
         This really needs to work in a separate runtime environment, or can query an api directly as a first try
         """
-        bt.logging.info("Resyncing the metagraph!")
-        await asyncio.to_thread(self.metagraph.sync, subtensor=self.subtensor, lite=True)
-
-        bt.logging.info("Got the capacities, now storing the info....")
-        incentives_tensor, axon_indexes_tensor = self.metagraph.incentive.sort(descending=True)
-
-        with self.threading_lock:
-            self.uid_to_uid_info = {}
-            self.uids: List[int] = self.metagraph.uids.tolist()
-            self.axon_indexes = axon_indexes_tensor.tolist()
-            self.incentives = incentives_tensor.tolist()
-            hotkeys: List[str] = self.metagraph.hotkeys  # noqa: F841
-            axons = self.metagraph.axons
-
-            for i in self.axon_indexes:
-                uid = self.uids[i]
-                self.uid_to_uid_info[uid] = utility_models.UIDinfo(
-                    uid=uid,
-                    axon=axons[i],
-                    hotkey=hotkeys[i],
-                )
+        await self._sync_metagraph()
 
         bt.logging.info("Finished extraction - now to fetch the available capacities for each axon")
         await self.fetch_available_capacities_for_each_axon()
 
         return
 
-    async def _post_miner_capacities_to_tauvision(self) -> None:
+    async def _sync_metagraph(self) -> None:
+        bt.logging.info("Resyncing the metagraph!")
+        await asyncio.to_thread(self.metagraph.sync, subtensor=self.subtensor, lite=True)
+
+        bt.logging.info("Got the metagraph, now storing the info....")
+        snapshot = metagraph_snapshot.from_metagraph(self.metagraph, self.netuid)
+        self._apply_metagraph_snapshot(snapshot)
+        try:
+            await asyncio.to_thread(metagraph_snapshot.save, snapshot, cst.METAGRAPH_SNAPSHOT_PATH)
+        except OSError as e:
+            bt.logging.warning(f"Couldn't save the metagraph snapshot: {e}")
+
+    def _apply_metagraph_snapshot(self, snapshot: metagraph_snapshot.MetagraphSnapshot) -> None:
+        """Only touches the uids that actually changed, so anything holding on to them isn't disturbed"""
+        new_uid_to_uid_info = snapshot.get_uid_infos()
+
+        with self.threading_lock:
+            self.uids = sorted(new_uid_to_uid_info.keys())
+            self.axon_indexes = [neuron.uid for neuron in snapshot.neurons]
+            self.incentives = [neuron.incentive for neuron in snapshot.neurons]
+
+            changed_uids: Set[int] = set()
+            for uid in list(self.uid_to_uid_info.keys()):
+                if uid not in new_uid_to_uid_info:
+                    del self.uid_to_uid_info[uid]
+                    changed_uids.add(uid)
+            for uid, uid_info in new_uid_to_uid_info.items():
+                old_uid_info = self.uid_to_uid_info.get(uid)
+                if old_uid_info is None or old_uid_info.hotkey != uid_info.hotkey or old_uid_info.axon != uid_info.axon:
+                    self.uid_to_uid_info[uid] = uid_info
+                    changed_uids.add(uid)
+
+            my_stake = snapshot.get_stake(self.public_hotkey_address)
+            if my_stake is not None and not self.is_testnet:
+                self._my_prop_of_stake = my_stake / snapshot.get_total_stake()
+
+        bt.logging.info(f"{len(changed_uids)} uids changed in the metagraph")
+        if changed_uids and self.uid_manager is not None:
+            self.uid_manager.apply_uid_info_changes(self.uid_to_uid_info, changed_uids)
+
+    async def _post_miner_capacities_to_tauvision(self, capacities_for_tasks: Dict[Task, Dict[int, float]]) -> None:
         data_to_post = []
-        for task in self.capacities_for_tasks:
-            for uid, volume in self.capacities_for_tasks[task].items():
+        for task in capacities_for_tasks:
+            for uid, volume in capacities_for_tasks[task].items():
                 hotkey = self.uid_to_uid_info[uid].hotkey
                 data_to_post.append(
                     post_stats.MinerCapacitiesPostObject(
@@ -266,10 +307,10 @@ class CoreValidator:
             data_type_to_post=post_stats.DataTypeToPost.MINER_CAPACITIES,
         )
 
-    def _post_uid_records_to_tauvision(self) -> None:
+    def _post_uid_records_to_tauvision(self, uid_records_for_tasks: Dict[Task, Dict[int, UIDRecord]]) -> None:
         data_to_post = []
-        for task in self.uid_manager.uid_records_for_tasks:
-            for record in self.uid_manager.uid_records_for_tasks[task].values():
+        for task in uid_records_for_tasks:
+            for record in uid_records_for_tasks[task].values():
                 data_to_post.append(
                     post_stats.UidRecordPostObject(
                         miner_hotkey=record.hotkey,
@@ -294,10 +335,10 @@ class CoreValidator:
             )
         )
 
-    def _post_uid_records_to_tauvision(self) -> None:
+    def _post_uid_records_to_tauvision(self, uid_records_for_tasks: Dict[Task, Dict[int, UIDRecord]]) -> None:
         data_to_post = []
-        for task in self.uid_manager.uid_records_for_tasks:
-            for record in self.uid_manager.uid_records_for_tasks[task].values():
+        for task in uid_records_for_tasks:
+            for record in uid_records_for_tasks[task].values():
                 data_to_post.append(
                     post_stats.UidRecordPostObject(
                         miner_hotkey=record.hotkey,
@@ -324,6 +365,15 @@ class CoreValidator:
 
     async def run_vali(self) -> None:
         await db_manager.delete_reward_data_after_update()
+        self.uid_manager = UidManager(
+            dendrite=self.dendrite,
+            validator_hotkey=self.keypair.ss58_address,
+            synthetic_data_manager=self.synthetic_data_manager,
+            synthetic_budget=self.synthetic_budget,
+            is_testnet=self.is_testnet,
+        )
+        period_finalization: Optional[asyncio.Task] = None
+        period_checkpointing: Optional[asyncio.Task] = None
         iteration = 1
         while True:
             await post_stats.post_to_tauvision(
@@ -338,49 +388,136 @@ class CoreValidator:
             await db_manager.delete_data_older_than_date(minutes=60 * 24)
             await db_manager.delete_tasks_older_than_date(minutes=120)
 
-            # Wait for initial syncing of metagraph
-            await self.resync_metagraph()
+            checkpoint = None
+            if iteration == 1:
+                checkpoint = period_checkpoint.load(
+                    cst.PERIOD_CHECKPOINT_PATH, self.netuid, self.public_hotkey_address
+                )
+
+            if self._boot_snapshot is not None:
+                # Go with the snapshot for now, and let the chain sync catch up in the background
+                self._apply_metagraph_snapshot(self._boot_snapshot)
+                self._boot_snapshot = None
+                if checkpoint is None:
+                    await self.fetch_available_capacities_for_each_axon()
+                self._background_metagraph_sync = asyncio.create_task(self._sync_metagraph())
+            elif checkpoint is not None:
+                # The checkpoint has the capacities, so only the metagraph is needed
+                await self._sync_metagraph()
+            else:
+                # Wait for initial syncing of metagraph
+                await self.resync_metagraph()
             self.scorer.start_scoring_results_if_not_already()
 
+            # The current period keeps serving organic queries until the next one is fully set up
+            if checkpoint is not None:
+                bt.logging.info("Resuming the scoring period from before the restart")
+                with self.threading_lock:
+                    self.capacities_for_tasks = checkpoint.get_capacities_for_tasks()
+                next_period = self.uid_manager.resume_period(checkpoint, self.uid_to_uid_info)
+            else:
+                next_period = self.uid_manager.stage_period(self.capacities_for_tasks, self.uid_to_uid_info)
+            finished_period = self.uid_manager.start_period(next_period)
+            if period_checkpointing is None:
+                period_checkpointing = asyncio.create_task(self._checkpoint_period_periodically())
+                period_checkpointing.add_done_callback(validation_utils.log_task_exception)
             bt.logging.info("🚀 Starting to score stuff, metagraph is synced...")
-            self.uid_manager = UidManager(
-                self.capacities_for_tasks,
-                dendrite=self.dendrite,
-                uid_to_uid_info=self.uid_to_uid_info,
-                validator_hotkey=self.keypair.ss58_address,
-                synthetic_data_manager=self.synthetic_data_manager,
-                is_testnet=self.is_testnet,
-            )
 
-            await self.uid_manager.start_synthetic_scoring()
-            await self.uid_manager.collect_synthetic_scoring_results()
-            self.uid_manager.calculate_period_scores_for_uids()
-            self._post_uid_records_to_tauvision()
-            await self.uid_manager.store_period_scores()
+            if finished_period is not None:
+                if period_finalization is not None:
+                    await period_finalization
+                period_finalization = asyncio.create_task(self._finalize_period(finished_period, iteration - 1))
 
-            bt.logging.info(f"Finished scoring for iteration: {iteration}. Now settings weights")
+            handoff_at = next_period.started_at + core_cst.SCORING_PERIOD_TIME - cst.PERIOD_HANDOFF_LEAD_SECONDS
+            # Paced by the clock, not by the period's work - it can finish early, or have had nothing to do at all
+            await asyncio.sleep(max(handoff_at - time.time(), cst.MIN_SECONDS_BETWEEN_PERIODS))
             iteration += 1
 
+    async def _checkpoint_period_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(cst.PERIOD_CHECKPOINT_INTERVAL_SECONDS)
+            checkpoint = self.uid_manager.checkpoint_current_period(self.netuid)
+            if checkpoint is None:
+                continue
+            try:
+                await asyncio.to_thread(period_checkpoint.save, checkpoint, cst.PERIOD_CHECKPOINT_PATH)
+            except OSError as e:
+                bt.logging.warning(f"Couldn't save the period checkpoint: {e}")
+
+    async def _finalize_period(self, period: ScoringPeriod, iteration: int) -> None:
+        """Waits out the period's last synthetic queries, then stores & posts its scores and sets weights"""
+        try:
+            await self.uid_manager.collect_synthetic_scoring_results(period)
+            period.calculate_period_scores_for_uids()
+            self._post_uid_records_to_tauvision(period.uid_records_for_tasks)
+            await self.uid_manager.store_period_scores(period)
+
+            bt.logging.info(f"Finished scoring for iteration: {iteration}. Now settings weights")
+            bt.logging.info(f"Dendrite connection pool waits: {self.dendrite.get_connection_pool_metrics()}")
+
+            # Weight setting needs the real metagraph
+            await self._wait_for_background_metagraph_sync()
+
             await self.weight_setter.start_weight_setting_process(
                 self.metagraph,
                 self.wallet,
                 self.config.netuid,
-                self.capacities_for_tasks,
+                period.capacities_for_tasks,
                 self.uid_to_uid_info,
                 self.task_weights,
             )
-
-            await asyncio.sleep(60)
+        except Exception as e:
+            bt.logging.error(f"Error finalizing the period for iteration {iteration}: {e}")
+
+    async def _wait_for_background_metagraph_sync(self) -> None:
+        """If the background sync failed, sync again now, rather than hang on to the failed task for good"""
+        background_sync = self._background_metagraph_sync
+        if background_sync is None:
+            return
+        try:
+            await background_sync
+        except Exception as e:
+            bt.logging.error(f"Background metagraph sync failed, syncing again: {e}")
+            await self._sync_metagraph()
+        finally:
+            self._background_metagraph_sync = None
 
     async def make_organic_query(
-        self, task: Task, stream: bool, outgoing_model: BaseModel, synapse: bt.Synapse
+        self, task: Task, stream: bool, outgoing_model: BaseModel, synapse: bt.Synapse, hedge: bool = False
     ) -> JSONResponse:
         if self.uid_manager is None:
             return JSONResponse(status_code=500, content={"message": "Server booting, one sec"})
 
-        return await self.uid_manager.make_organic_query(
-            task=task, synapse=synapse, stream=stream, outgoing_model=outgoing_model
-        )
+        try:
+            await self.admission_controller.acquire(task)
+        except AdmissionRejected as e:
+            return JSONResponse(
+                status_code=429,
+                content={"message": "Too many requests for this task right now, please retry shortly"},
+                headers={"Retry-After": str(e.retry_after)},
+            )
+
+        try:
+            result = await self.uid_manager.make_organic_query(
+                task=task, synapse=synapse, stream=stream, outgoing_model=outgoing_model, hedge=hedge
+            )
+        except BaseException:
+            self.admission_controller.release(task)
+            raise
+
+        if stream and not isinstance(result, JSONResponse):
+            # Slot is held until the stream is done
+            return self.admission_controller.release_when_finished(task, result)
+        self.admission_controller.release(task)
+        return result
+
+
+_core_validator: Optional[CoreValidator] = None
 
 
-core_validator = CoreValidator()
+def get_core_validator() -> CoreValidator:
+    """Built on first use, so importing this module doesn't do anything. Call initialize() on it before use"""
+    global _core_validator
+    if _core_validator is None:
+        _core_validator = CoreValidator()
+    return _core_validator
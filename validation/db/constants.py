@@ -2,6 +2,7 @@
 TABLE_TASKS = "tasks"
 TABLE_REWARD_DATA = "reward_data"
 TABLE_UID_RECORDS = "uid_records"
+TABLE_USAGE_LEDGER_BATCHES = "usage_ledger_batches"
 
 # Common column names
 COLUMN_ID = "id"
@@ -137,6 +137,8 @@ class DatabaseManager:
             await self.conn.execute(sql.delete_reward_data_older_than(), (cutoff_time_str,))
             await self.conn.execute(sql.delete_uid_data_older_than(), (cutoff_time_str,))
             await self.conn.execute(sql.delete_task_data_older_than(), (cutoff_time_str,))
+            # Batch ids are only checked while their batch file is still around, which is never this long
+            await self.conn.execute(sql.delete_usage_ledger_batches_older_than(), (cutoff_time_str,))
 
             await self.conn.commit()
 
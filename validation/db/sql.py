@@ -68,6 +68,12 @@ def delete_uid_data_older_than() -> str:
     """
 
 
+def delete_usage_ledger_batches_older_than() -> str:
+    return f"""
+    DELETE FROM {cst.TABLE_USAGE_LEDGER_BATCHES} WHERE {cst.COLUMN_CREATED_AT} < ?
+    """
+
+
 def delete_oldest_rows_from_tasks(limit: int = 10) -> str:
     return f"""
     DELETE FROM {cst.TABLE_TASKS}
@@ -0,0 +1,97 @@
+"""
+On-disk snapshot of the bits of the metagraph the validator needs (hotkeys, axons, stake, incentive).
+
+Loading it at boot is instant, where syncing the metagraph from the chain can take minutes, so the validator
+can get going straight away and reconcile with the chain in the background.
+"""
+
+import dataclasses
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import bittensor as bt
+from pydantic import BaseModel, ValidationError
+
+from core import constants as core_cst
+from models import utility_models
+from validation.models import axon_uid
+
+
+class NeuronSnapshot(BaseModel):
+    uid: axon_uid
+    hotkey: str
+    axon: Dict[str, Any]
+    stake: float
+    incentive: float
+
+
+class MetagraphSnapshot(BaseModel):
+    netuid: int
+    created_at: float
+    # Highest incentive first, same as the order the validator works through them
+    neurons: List[NeuronSnapshot]
+
+    def get_stake(self, hotkey: str) -> Optional[float]:
+        for neuron in self.neurons:
+            if neuron.hotkey == hotkey:
+                return neuron.stake
+        return None
+
+    def get_uid(self, hotkey: str) -> Optional[axon_uid]:
+        for neuron in self.neurons:
+            if neuron.hotkey == hotkey:
+                return neuron.uid
+        return None
+
+    def get_total_stake(self) -> float:
+        return sum(neuron.stake for neuron in self.neurons)
+
+    def get_uid_infos(self) -> Dict[axon_uid, utility_models.UIDinfo]:
+        return {
+            neuron.uid: utility_models.UIDinfo(
+                uid=neuron.uid, hotkey=neuron.hotkey, axon=bt.chain_data.AxonInfo(**neuron.axon)
+            )
+            for neuron in self.neurons
+        }
+
+
+def from_metagraph(metagraph: bt.metagraph, netuid: int) -> MetagraphSnapshot:
+    incentives, axon_indexes = metagraph.incentive.sort(descending=True)
+    uids: List[int] = metagraph.uids.tolist()
+    stakes: List[float] = metagraph.S.tolist()
+    neurons = [
+        NeuronSnapshot(
+            uid=uids[i],
+            hotkey=metagraph.hotkeys[i],
+            axon=dataclasses.asdict(metagraph.axons[i]),
+            stake=stakes[i],
+            incentive=incentive,
+        )
+        for i, incentive in zip(axon_indexes.tolist(), incentives.tolist())
+    ]
+    return MetagraphSnapshot(netuid=netuid, created_at=time.time(), neurons=neurons)
+
+
+def load(path: str, netuid: int) -> Optional[MetagraphSnapshot]:
+    if not os.path.exists(path):
+        return None
+    try:
+        snapshot = MetagraphSnapshot.parse_file(path)
+    except (ValidationError, ValueError, OSError) as e:
+        bt.logging.warning(f"Ignoring unreadable metagraph snapshot at {path}: {e}")
+        return None
+    if snapshot.netuid != netuid or not snapshot.neurons:
+        return None
+    if time.time() - snapshot.created_at > core_cst.SCORING_PERIOD_TIME:
+        bt.logging.info("Metagraph snapshot is over a scoring period old, syncing from the chain instead")
+        return None
+    return snapshot
+
+
+def save(snapshot: MetagraphSnapshot, path: str) -> None:
+    # Write then rename, so a crash mid write can't leave a half written snapshot behind
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(snapshot.json())
+    os.replace(temp_path, path)
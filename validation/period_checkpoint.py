@@ -0,0 +1,72 @@
+"""
+On-disk checkpoint of the scoring period in progress: the uid record counters, queue order & capacities.
+
+The validator gets restarted every few hours, and without this each restart throws away everything the current
+period has done so far. Resuming from a recent checkpoint means the synthetic queries already made still count.
+"""
+
+import os
+import time
+from typing import Dict, List, Optional
+
+import bittensor as bt
+from pydantic import BaseModel, ValidationError
+
+from core import Task
+from validation.models import axon_uid
+from validation.proxy.utils import constants as cst
+
+
+class UIDRecordCheckpoint(BaseModel):
+    task: Task
+    uid: axon_uid
+    hotkey: str
+    declared_volume: float
+    volume_to_score: float
+    synthetic_requests_still_to_make: int
+    consumed_volume: float
+    total_requests_made: int
+    requests_429: int
+    requests_500: int
+
+
+class PeriodCheckpoint(BaseModel):
+    netuid: int
+    validator_hotkey: str
+    started_at: float
+    created_at: float
+    # Keyed by task value, since json can't have enums as keys
+    capacities: Dict[str, Dict[axon_uid, float]]
+    queued_uids: Dict[str, List[axon_uid]]
+    records: List[UIDRecordCheckpoint]
+
+    def get_capacities_for_tasks(self) -> Dict[Task, Dict[axon_uid, float]]:
+        return {Task(task): capacities for task, capacities in self.capacities.items()}
+
+    def get_queued_uids(self, task: Task) -> List[axon_uid]:
+        return self.queued_uids.get(task.value, [])
+
+
+def load(path: str, netuid: int, validator_hotkey: str) -> Optional[PeriodCheckpoint]:
+    """The checkpoint, if there's one for this validator that's recent enough to pick back up from"""
+    if not os.path.exists(path):
+        return None
+    try:
+        checkpoint = PeriodCheckpoint.parse_file(path)
+    except (ValidationError, ValueError, OSError) as e:
+        bt.logging.warning(f"Ignoring unreadable period checkpoint at {path}: {e}")
+        return None
+    if checkpoint.netuid != netuid or checkpoint.validator_hotkey != validator_hotkey:
+        return None
+    if time.time() - checkpoint.created_at > cst.PERIOD_CHECKPOINT_MAX_AGE_SECONDS:
+        bt.logging.info("Period checkpoint is too old to resume from, starting a fresh period")
+        return None
+    return checkpoint
+
+
+def save(checkpoint: PeriodCheckpoint, path: str) -> None:
+    # Write then rename, so a crash mid write can't leave a half written checkpoint behind
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(checkpoint.json())
+    os.replace(temp_path, path)
@@ -0,0 +1,136 @@
+"""
+Admission control for organic queries.
+
+Each task gets a limit on in-flight organic requests, from the summed declared capacity of its miners
+(Little's law: requests per second the miners said they'll take * how long a request usually takes).
+Excess requests wait in a bounded fifo for a slot. If the queue is full, or they wait too long, they get
+a 429 with a Retry-After straight away, instead of being sent on to a miner who'll just say 429 anyway.
+"""
+
+import asyncio
+import math
+import time
+from collections import defaultdict, deque
+from typing import AsyncGenerator, Callable, Deque, Dict, Optional, Tuple
+
+from core import Task, constants as core_cst, tasks
+from validation.models import axon_uid
+from validation.proxy.utils import constants as cst
+from validation.proxy.utils.miner_selection import miner_selector
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f"Too many requests in flight, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class _TaskAdmissionState:
+    __slots__ = ("in_flight", "waiters", "limit", "limit_calculated_at")
+
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.limit = cst.MIN_ORGANIC_IN_FLIGHT_PER_TASK
+        self.limit_calculated_at: Optional[float] = None
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        get_capacities_for_tasks: Callable[[], Dict[Task, Dict[axon_uid, float]]],
+        queue_size: int = cst.ORGANIC_ADMISSION_QUEUE_SIZE,
+        max_wait_seconds: float = cst.ORGANIC_ADMISSION_MAX_WAIT_SECONDS,
+    ) -> None:
+        self.get_capacities_for_tasks = get_capacities_for_tasks
+        self.queue_size = queue_size
+        self.max_wait_seconds = max_wait_seconds
+        self._states: Dict[Task, _TaskAdmissionState] = defaultdict(_TaskAdmissionState)
+
+    @staticmethod
+    def _get_typical_latency(task: Task) -> float:
+        typical_latency = miner_selector.get_latency_percentile(task, 50)
+        if typical_latency is not None:
+            return typical_latency
+        synapse_name = tasks.TASKS_TO_SYNAPSE[task].__name__ if task in tasks.TASKS_TO_SYNAPSE else ""
+        return cst.OPERATION_TIMEOUTS.get(synapse_name, 15) / 2
+
+    def _calculate_limit(self, task: Task) -> int:
+        capacities = self.get_capacities_for_tasks().get(task, {})
+        volume_to_requests_conversion = cst.TASK_TO_VOLUME_TO_REQUESTS_CONVERSION.get(task)
+        if not capacities or not volume_to_requests_conversion:
+            return cst.MIN_ORGANIC_IN_FLIGHT_PER_TASK
+
+        requests_per_second = sum(capacities.values()) / volume_to_requests_conversion / core_cst.SCORING_PERIOD_TIME
+        max_in_flight = math.ceil(requests_per_second * self._get_typical_latency(task))
+        return max(max_in_flight, cst.MIN_ORGANIC_IN_FLIGHT_PER_TASK)
+
+    def _get_state(self, task: Task) -> _TaskAdmissionState:
+        state = self._states[task]
+        now = time.time()
+        if state.limit_calculated_at is None or now - state.limit_calculated_at > cst.ADMISSION_LIMIT_REFRESH_SECONDS:
+            state.limit = self._calculate_limit(task)
+            state.limit_calculated_at = now
+        return state
+
+    def _get_retry_after(self, task: Task, state: _TaskAdmissionState) -> int:
+        # Roughly how long until everyone ahead of you has been served
+        queued_rounds = (len(state.waiters) + 1) / max(state.limit, 1)
+        return max(math.ceil(queued_rounds * self._get_typical_latency(task)), 1)
+
+    def get_stats(self) -> Dict[Task, Tuple[int, int, int]]:
+        """task -> (in flight, queued, limit), handy for logging"""
+        return {task: (state.in_flight, len(state.waiters), state.limit) for task, state in self._states.items()}
+
+    def get_in_flight(self, task: Optional[Task] = None) -> int:
+        if task is not None:
+            return self._states[task].in_flight if task in self._states else 0
+        return sum(state.in_flight for state in self._states.values())
+
+    async def acquire(self, task: Task) -> None:
+        """Takes a slot for the task, queueing if needed. Raises AdmissionRejected if we can't get one in time"""
+        state = self._get_state(task)
+        if state.in_flight < state.limit and not state.waiters:
+            state.in_flight += 1
+            return
+
+        if len(state.waiters) >= self.queue_size:
+            raise AdmissionRejected(self._get_retry_after(task, state))
+
+        waiter = asyncio.get_running_loop().create_future()
+        state.waiters.append(waiter)
+        acquired = False
+        try:
+            # The slot is handed straight over to us by release(), so in_flight is already counted
+            await asyncio.wait_for(waiter, timeout=self.max_wait_seconds)
+            acquired = True
+        except asyncio.TimeoutError:
+            raise AdmissionRejected(self._get_retry_after(task, state))
+        finally:
+            if not acquired:
+                if waiter.done() and not waiter.cancelled():
+                    # We were handed the slot, but are leaving without it (timed out or cancelled at the same
+                    # time), and nobody will release it for us
+                    self.release(task)
+                else:
+                    try:
+                        state.waiters.remove(waiter)
+                    except ValueError:
+                        pass
+
+    def release(self, task: Task) -> None:
+        state = self._states[task]
+        while state.waiters and state.in_flight <= state.limit:
+            waiter = state.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        state.in_flight = max(state.in_flight - 1, 0)
+
+    async def release_when_finished(self, task: Task, generator: AsyncGenerator) -> AsyncGenerator:
+        try:
+            async for chunk in generator:
+                yield chunk
+        finally:
+            self.release(task)
+
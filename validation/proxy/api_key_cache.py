@@ -0,0 +1,154 @@
+"""
+In-process cache of api key info + per key token bucket rate limiting, for the api middleware.
+
+The database is still the source of truth (the vision cli edits keys in a different process),
+so cached entries expire after a ttl, and a background loop periodically reconciles every
+cached key against sqlite in one query.
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+import aiosqlite
+import bittensor as bt
+
+from validation.proxy import sql
+from validation.proxy.usage_ledger import usage_ledger
+from validation.proxy.utils import constants as cst
+
+
+class TokenBucket:
+    """O(1) token bucket, refilling continuously to `rate_limit_per_minute` tokens over a minute"""
+
+    __slots__ = ("capacity", "refill_rate", "tokens", "last_refill")
+
+    def __init__(self, rate_limit_per_minute: float, tokens: Optional[float] = None) -> None:
+        self.capacity = float(rate_limit_per_minute)
+        self.refill_rate = self.capacity / 60
+        self.tokens = self.capacity if tokens is None else min(max(tokens, 0.0), self.capacity)
+        self.last_refill = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_rate)
+        self.last_refill = now
+
+    def set_rate_limit(self, rate_limit_per_minute: float) -> None:
+        self._refill()
+        self.capacity = float(rate_limit_per_minute)
+        self.refill_rate = self.capacity / 60
+        self.tokens = min(self.tokens, self.capacity)
+
+    def try_consume(self, amount: float = 1.0) -> bool:
+        self._refill()
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+
+class _CachedApiKey:
+    __slots__ = ("info", "fetched_at")
+
+    def __init__(self, info: Optional[Dict[str, Any]]) -> None:
+        self.info = info
+        self.fetched_at = time.monotonic()
+
+
+class ApiKeyCache:
+    def __init__(
+        self,
+        ttl: float = cst.API_KEY_CACHE_TTL_SECONDS,
+        invalid_key_ttl: float = cst.INVALID_API_KEY_CACHE_TTL_SECONDS,
+        reconcile_interval: float = cst.API_KEY_RECONCILE_INTERVAL_SECONDS,
+    ) -> None:
+        self.ttl = ttl
+        self.invalid_key_ttl = invalid_key_ttl
+        self.reconcile_interval = reconcile_interval
+
+        self._entries: Dict[str, _CachedApiKey] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._reconcile_task: Optional[asyncio.Task] = None
+
+    def _is_fresh(self, entry: _CachedApiKey) -> bool:
+        ttl = self.ttl if entry.info is not None else self.invalid_key_ttl
+        return time.monotonic() - entry.fetched_at < ttl
+
+    def _ensure_reconciling(self) -> None:
+        # Started lazily so it always lives on the loop that's serving requests
+        if self._reconcile_task is None or self._reconcile_task.done():
+            self._reconcile_task = asyncio.create_task(self._continuously_reconcile())
+
+    async def get_api_key_info(self, api_key: str) -> Optional[Dict[str, Any]]:
+        """Returns a copy of the key info, only touching the db if the cached entry is missing or stale"""
+        self._ensure_reconciling()
+
+        entry = self._entries.get(api_key)
+        if entry is None or not self._is_fresh(entry):
+            async with aiosqlite.connect(sql.DATABASE_PATH) as conn:
+                api_key_info = await sql.get_api_key_info(conn, api_key)
+                if api_key_info is not None and api_key not in self._buckets:
+                    recent_requests = await sql.get_number_of_requests_in_last_minute(conn, api_key)
+                    rate_limit = api_key_info[sql.RATE_LIMIT_PER_MINUTE]
+                    self._buckets[api_key] = TokenBucket(rate_limit, tokens=rate_limit - recent_requests)
+            entry = self._store(api_key, api_key_info)
+
+        return dict(entry.info) if entry.info is not None else None
+
+    def _store(self, api_key: str, api_key_info: Optional[Dict[str, Any]]) -> _CachedApiKey:
+        if api_key_info is not None and api_key_info[sql.BALANCE] is not None:
+            # The db doesn't know about usage still sitting in the ledger yet
+            api_key_info[sql.BALANCE] -= usage_ledger.pending_debits.get(api_key, 0)
+        entry = _CachedApiKey(api_key_info)
+        self._entries[api_key] = entry
+        if api_key_info is None:
+            self._buckets.pop(api_key, None)
+        else:
+            bucket = self._buckets.get(api_key)
+            if bucket is None:
+                self._buckets[api_key] = TokenBucket(api_key_info[sql.RATE_LIMIT_PER_MINUTE])
+            elif bucket.capacity != api_key_info[sql.RATE_LIMIT_PER_MINUTE]:
+                bucket.set_rate_limit(api_key_info[sql.RATE_LIMIT_PER_MINUTE])
+        return entry
+
+    def rate_limit_exceeded(self, api_key_info: Dict[str, Any]) -> bool:
+        bucket = self._buckets.get(api_key_info[sql.KEY])
+        if bucket is None:
+            bucket = TokenBucket(api_key_info[sql.RATE_LIMIT_PER_MINUTE])
+            self._buckets[api_key_info[sql.KEY]] = bucket
+        return not bucket.try_consume()
+
+    def debit(self, api_key: str, cost: float) -> None:
+        """Keep the cached balance in step with the db between reconciliations"""
+        entry = self._entries.get(api_key)
+        if entry is not None and entry.info is not None and entry.info[sql.BALANCE] is not None:
+            entry.info[sql.BALANCE] -= cost
+
+    async def reconcile(self) -> None:
+        async with aiosqlite.connect(sql.DATABASE_PATH) as conn:
+            all_api_key_infos = await sql.get_all_api_keys(conn)
+
+        api_key_infos = {info[sql.KEY]: info for info in all_api_key_infos if info is not None}
+        for api_key, entry in list(self._entries.items()):
+            api_key_info = api_key_infos.get(api_key)
+            if api_key_info is None and entry.info is None and not self._is_fresh(entry):
+                # Stops junk keys from piling up in memory
+                del self._entries[api_key]
+            else:
+                self._store(api_key, api_key_info)
+
+        for api_key in list(self._buckets.keys()):
+            if api_key not in api_key_infos:
+                self._buckets.pop(api_key)
+
+    async def _continuously_reconcile(self) -> None:
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                bt.logging.warning(f"Failed to reconcile the api key cache with the db: {e}")
+
+
+api_key_cache = ApiKeyCache()
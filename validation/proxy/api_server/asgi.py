@@ -3,13 +3,13 @@ from fastapi.responses import JSONResponse
 from starlette import status
 import uvicorn
 import asyncio
-import aiosqlite
 from config.validator_config import config as validator_config
 from validation.proxy.api_server.image.endpoints import router as image_router
 from validation.proxy.api_server.text.endpoints import router as text_router
-from validation.core_validator import core_validator
+from validation.core_validator import get_core_validator
 from validation.proxy import sql
-from validation.db.db_management import db_manager
+from validation.proxy.api_key_cache import api_key_cache
+from validation.proxy.usage_ledger import usage_ledger
 
 app = FastAPI(debug=False)
 
@@ -18,7 +18,9 @@ app.include_router(text_router)
 
 
 async def main():
-    await db_manager.initialize()
+    core_validator = get_core_validator()
+    await core_validator.initialize()
+    await usage_ledger.initialize()
     core_validator.start_continuous_tasks()
 
     port = validator_config.api_server_port
@@ -61,31 +63,27 @@ async def api_key_validator(request: Request, call_next):
             content={"detail": "API key is missing"},
         )
 
-    async with aiosqlite.connect(sql.DATABASE_PATH) as conn:
-        api_key_info = await sql.get_api_key_info(conn, api_key)
-        if api_key_info is None:
-            return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"detail": "Invalid API key"})
-        endpoint = request.url.path.split("/")[-1]
-        credits_required = ENDPOINT_TO_CREDITS_USED.get(endpoint, 1)
+    api_key_info = await api_key_cache.get_api_key_info(api_key)
+    if api_key_info is None:
+        return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"detail": "Invalid API key"})
+    endpoint = request.url.path.split("/")[-1]
+    credits_required = ENDPOINT_TO_CREDITS_USED.get(endpoint, 1)
 
-        if api_key_info[sql.BALANCE] is not None and api_key_info[sql.BALANCE] <= credits_required:
-            return JSONResponse(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS, content={"detail": "Insufficient credits - sorry!"}
-            )
+    if api_key_info[sql.BALANCE] is not None and api_key_info[sql.BALANCE] <= credits_required:
+        return JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS, content={"detail": "Insufficient credits - sorry!"}
+        )
 
-        rate_limit_exceeded = await sql.rate_limit_exceeded(conn, api_key_info)
-        if rate_limit_exceeded:
-            return JSONResponse(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS, content={"detail": "Rate limit exceeded - sorry!"}
-            )
+    if api_key_cache.rate_limit_exceeded(api_key_info):
+        return JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS, content={"detail": "Rate limit exceeded - sorry!"}
+        )
 
     response = await call_next(request)
 
     if response.status_code == 200:
-        async with aiosqlite.connect(sql.DATABASE_PATH) as conn:
-            await sql.update_requests_and_credits(conn, api_key_info, credits_required)
-            await sql.log_request(conn, api_key_info, request.url.path, credits_required)
-            await conn.commit()
+        api_key_cache.debit(api_key_info[sql.KEY], credits_required)
+        usage_ledger.record(api_key_info, request.url.path, credits_required)
 
     return response
 
@@ -5,7 +5,7 @@ from models import base_models, synapses, utility_models, request_models
 from validation.proxy import get_synapse, validation_utils
 from fastapi import routing
 from validation.proxy.api_server.image import utils
-from validation.core_validator import core_validator
+from validation.core_validator import get_core_validator
 
 from validation.proxy import dependencies
 
@@ -22,11 +22,12 @@ async def text_to_image(
         synapse_model=synapses.TextToImage,
     )
 
-    result: utility_models.QueryResult = await core_validator.make_organic_query(
+    result: utility_models.QueryResult = await get_core_validator().make_organic_query(
         synapse=synapse,
         outgoing_model=base_models.TextToImageOutgoing,
         task=Task(synapse.engine + "-text-to-image"),
         stream=False,
+        hedge=True,
     )
     if isinstance(result, JSONResponse):
         return result
@@ -48,11 +49,12 @@ async def image_to_image(
         synapse_model=synapses.ImageToImage,
     )
 
-    result: utility_models.QueryResult = await core_validator.make_organic_query(
+    result: utility_models.QueryResult = await get_core_validator().make_organic_query(
         synapse=synapse,
         outgoing_model=base_models.ImageToImageOutgoing,
         task=Task(synapse.engine + "-image-to-image"),
         stream=False,
+        hedge=True,
     )
     if isinstance(result, JSONResponse):
         return result
@@ -74,8 +76,8 @@ async def inpaint(
         synapse_model=synapses.Inpaint,
     )
 
-    result = await core_validator.make_organic_query(
-        synapse=synapse, outgoing_model=base_models.InpaintOutgoing, task=Task("inpaint"), stream=False
+    result = await get_core_validator().make_organic_query(
+        synapse=synapse, outgoing_model=base_models.InpaintOutgoing, task=Task("inpaint"), stream=False, hedge=True
     )
     if isinstance(result, JSONResponse):
         return result
@@ -98,8 +100,8 @@ async def avatar(
         synapse_model=synapses.Avatar,
     )
 
-    result = await core_validator.make_organic_query(
-        synapse=synapse, outgoing_model=base_models.AvatarOutgoing, task=Task("avatar"), stream=False
+    result = await get_core_validator().make_organic_query(
+        synapse=synapse, outgoing_model=base_models.AvatarOutgoing, task=Task("avatar"), stream=False, hedge=True
     )
     if isinstance(result, JSONResponse):
         return result
@@ -122,7 +124,7 @@ async def avatar(
 #         synapse_model=synapses.Upscale,
 #     )
 
-#     result = await core_validator.make_organic_query(
+#     result = await get_core_validator().make_organic_query(
 #         synapse=synapse, outgoing_model=base_models.UpscaleOutgoing, task=Task("upscale"), stream=False
 #     )
 #     if isinstance(result, JSONResponse):
@@ -147,7 +149,7 @@ async def avatar(
 #         synapse_model=synapses.ClipEmbeddings,
 #     )
 
-#     result = await core_validator.make_organic_query(
+#     result = await get_core_validator().make_organic_query(
 #         synapse=synapse,
 #         outgoing_model=base_models.ClipEmbeddingsOutgoing,
 #         task=Task("clip-image-embeddings"),
@@ -5,7 +5,7 @@ from validation.proxy import get_synapse
 from starlette.responses import StreamingResponse
 from core import tasks
 from fastapi.routing import APIRouter
-from validation.core_validator import core_validator
+from validation.core_validator import get_core_validator
 import fastapi
 from validation.proxy import dependencies
 
@@ -37,7 +37,7 @@ async def chat(
     else:
         raise HTTPException(status_code=400, detail="Invalid model provided")
 
-    text_generator = await core_validator.make_organic_query(
+    text_generator = await get_core_validator().make_organic_query(
         synapse=synapse, outgoing_model=base_models.ChatOutgoing, stream=True, task=task
     )
     if isinstance(text_generator, JSONResponse):
@@ -1,6 +1,6 @@
 import aiosqlite
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from validation.db.db_management import db_lock
 
 BALANCE = "balance"
@@ -14,6 +14,8 @@ RATE_LIMIT_PER_MINUTE = "rate_limit_per_minute"
 API_KEYS_TABLE = "api_keys"
 LOGS_TABLE = "logs"
 CREATED_AT = "created_at"
+USAGE_LEDGER_BATCHES_TABLE = "usage_ledger_batches"
+BATCH_ID = "batch_id"
 
 DATABASE_PATH = "vision_database.db"
 
@@ -154,14 +156,44 @@ async def log_request(conn: aiosqlite.Connection, api_key_info: Dict[str, Any],
         await conn.commit()
 
 
-async def rate_limit_exceeded(conn: aiosqlite.Connection, api_key_info: Dict[str, Any]) -> bool:
+async def usage_batch_already_applied(conn: aiosqlite.Connection, batch_id: str) -> bool:
+    async with db_lock:
+        async with conn.execute(
+            f"SELECT 1 FROM {USAGE_LEDGER_BATCHES_TABLE} WHERE {BATCH_ID} = ?", (batch_id,)
+        ) as cursor:
+            return await cursor.fetchone() is not None
+
+
+async def apply_usage_batch(
+    conn: aiosqlite.Connection,
+    batch_id: str,
+    debits: List[Tuple[float, str]],
+    log_rows: List[Tuple[str, str, Optional[float], str, float]],
+) -> None:
+    """Applies a whole batch of balance debits & request logs in one transaction, marking the batch as applied"""
+    async with db_lock:
+        await conn.executemany(f"UPDATE {API_KEYS_TABLE} SET {BALANCE} = {BALANCE} - ? WHERE {KEY} = ?", debits)
+        await conn.executemany(
+            f"INSERT INTO {LOGS_TABLE} ({KEY}, {ENDPOINT}, {BALANCE}, {CREATED_AT}, {COST}) VALUES (?, ?, ?, ?, ?)",
+            log_rows,
+        )
+        await conn.execute(f"INSERT INTO {USAGE_LEDGER_BATCHES_TABLE} ({BATCH_ID}) VALUES (?)", (batch_id,))
+        await conn.commit()
+
+
+async def get_number_of_requests_in_last_minute(conn: aiosqlite.Connection, api_key: str) -> int:
     async with db_lock:
         one_minute_ago = datetime.now() - timedelta(minutes=1)
         query = f"""
-            SELECT *
+            SELECT COUNT(*)
             FROM {LOGS_TABLE}
             WHERE {KEY} = ? AND {CREATED_AT} >= ?
         """
-        async with conn.execute(query, (api_key_info[KEY], one_minute_ago.strftime("%Y-%m-%d %H:%M:%S"))) as cursor:
-            recent_logs = await cursor.fetchall()
-            return len(recent_logs) >= api_key_info[RATE_LIMIT_PER_MINUTE]
+        async with conn.execute(query, (api_key, one_minute_ago.strftime("%Y-%m-%d %H:%M:%S"))) as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else 0
+
+
+async def rate_limit_exceeded(conn: aiosqlite.Connection, api_key_info: Dict[str, Any]) -> bool:
+    number_of_recent_requests = await get_number_of_requests_in_last_minute(conn, api_key_info[KEY])
+    return number_of_recent_requests >= api_key_info[RATE_LIMIT_PER_MINUTE]
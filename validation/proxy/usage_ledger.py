@@ -0,0 +1,179 @@
+"""
+Write-behind ledger for api usage (balance debits + request logs).
+
+Every successful request is appended to an in-memory journal and to an append-only journal file,
+then a background flusher writes everything in one transaction every few hundred ms (or as soon
+as a batch fills up), instead of two commits per request under the db lock.
+
+Crash safety: on flush the live journal file is renamed to `<journal>.<batch_id>.batch`, and the
+batch id is recorded in the same transaction as the writes. The journal is fsynced before it's renamed, and any
+batch files left over after a crash are replayed on startup, skipping the ones whose batch id already made it into
+the db. Batch ids are pruned along with the rest of the day old data.
+"""
+
+import asyncio
+import glob
+import os
+import sqlite3
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiosqlite
+import bittensor as bt
+import ujson as json
+
+from validation.proxy import sql
+from validation.proxy.utils import constants as cst
+
+# api_key, endpoint, cost, balance, created_at
+LedgerEntry = Tuple[str, str, float, Optional[float], str]
+
+_BATCH_SUFFIX = ".batch"
+
+
+class UsageLedger:
+    def __init__(
+        self,
+        journal_path: str = cst.USAGE_LEDGER_JOURNAL_PATH,
+        flush_interval_ms: float = cst.USAGE_LEDGER_FLUSH_INTERVAL_MS,
+        max_batch_size: int = cst.USAGE_LEDGER_MAX_BATCH_SIZE,
+    ) -> None:
+        self.journal_path = journal_path
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch_size = max_batch_size
+
+        self._entries: List[LedgerEntry] = []
+        self._initialized = False
+        # batch_id -> (entries, need to check if the batch was already applied)
+        self._unapplied_batches: Dict[str, Tuple[List[LedgerEntry], bool]] = {}
+        self.pending_debits: Dict[str, float] = defaultdict(float)
+
+        self._flush_needed: Optional[asyncio.Event] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def _batch_path(self, batch_id: str) -> str:
+        return f"{self.journal_path}.{batch_id}{_BATCH_SUFFIX}"
+
+    def _load_leftovers(self) -> None:
+        if self._initialized:
+            return
+        if os.path.exists(self.journal_path):
+            # Left over from a previous run which didn't get to flush it
+            os.rename(self.journal_path, self._batch_path(uuid.uuid4().hex))
+        self._load_leftover_batches()
+        self._initialized = True
+
+    async def initialize(self) -> None:
+        """
+        Replays whatever the last run left behind, before the api starts serving & debiting again.
+        Raises if it can't, rather than start serving with balances the db doesn't know about yet
+        """
+        self._load_leftovers()
+        if self._unapplied_batches:
+            await self.flush()
+
+    def _load_leftover_batches(self) -> None:
+        for batch_path in glob.glob(f"{glob.escape(self.journal_path)}.*{_BATCH_SUFFIX}"):
+            batch_id = batch_path[len(self.journal_path) + 1 : -len(_BATCH_SUFFIX)]
+            entries = []
+            with open(batch_path) as f:
+                for line in f:
+                    try:
+                        entries.append(tuple(json.loads(line)))
+                    except ValueError:
+                        # Torn final write from a crash - that request never got its response anyway
+                        bt.logging.warning(f"Skipping corrupt line in usage ledger batch {batch_path}")
+            for entry in entries:
+                self.pending_debits[entry[0]] += entry[2]
+            self._unapplied_batches[batch_id] = (entries, True)
+        if self._unapplied_batches:
+            bt.logging.info(f"Replaying {len(self._unapplied_batches)} usage ledger batches left over from last run")
+
+    def _ensure_flushing(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_needed = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._continuously_flush())
+
+    def record(self, api_key_info: Dict[str, Any], path: str, cost: float) -> None:
+        """Cheap enough to call on the request path - no awaits, no db"""
+        self._ensure_flushing()
+        self._load_leftovers()
+
+        entry: LedgerEntry = (
+            api_key_info[sql.KEY],
+            path,
+            cost,
+            api_key_info[sql.BALANCE],
+            datetime.now().isoformat(" "),
+        )
+        with open(self.journal_path, "a") as journal:
+            journal.write(json.dumps(entry) + "\n")
+        self._entries.append(entry)
+        self.pending_debits[entry[0]] += cost
+
+        if len(self._entries) >= self.max_batch_size:
+            self._flush_needed.set()
+
+    def _rotate(self) -> None:
+        """Moves the current entries into their own batch. No awaits in here, so nothing can sneak in between"""
+        if not self._entries:
+            return
+        batch_id = uuid.uuid4().hex
+        # Writes only get the entries as far as the os - make sure they're on disk before the rename
+        with open(self.journal_path, "rb") as journal:
+            os.fsync(journal.fileno())
+        os.rename(self.journal_path, self._batch_path(batch_id))
+
+        self._unapplied_batches[batch_id] = (self._entries, False)
+        self._entries = []
+
+    async def flush(self) -> None:
+        self._load_leftovers()
+        self._rotate()
+        if not self._unapplied_batches:
+            return
+
+        async with aiosqlite.connect(sql.DATABASE_PATH) as conn:
+            for batch_id, (entries, check_if_applied) in list(self._unapplied_batches.items()):
+                try:
+                    if not check_if_applied or not await sql.usage_batch_already_applied(conn, batch_id):
+                        await self._apply_batch(conn, batch_id, entries)
+                except sqlite3.Error:
+                    bt.logging.error(f"Failed to apply usage ledger batch {self._batch_path(batch_id)}")
+                    raise
+
+                del self._unapplied_batches[batch_id]
+                os.remove(self._batch_path(batch_id))
+                for entry in entries:
+                    self.pending_debits[entry[0]] -= entry[2]
+                    if self.pending_debits[entry[0]] < 1e-9:
+                        self.pending_debits.pop(entry[0], None)
+
+    @staticmethod
+    async def _apply_batch(conn: aiosqlite.Connection, batch_id: str, entries: List[LedgerEntry]) -> None:
+        debits_for_keys: Dict[str, float] = defaultdict(float)
+        for api_key, _, cost, _, _ in entries:
+            debits_for_keys[api_key] += cost
+
+        debits = [(cost, api_key) for api_key, cost in debits_for_keys.items()]
+        log_rows = [(api_key, path, balance, created_at, cost) for api_key, path, cost, balance, created_at in entries]
+        await sql.apply_usage_batch(conn, batch_id, debits, log_rows)
+
+    async def _continuously_flush(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+
+            try:
+                await self.flush()
+            except (sqlite3.Error, OSError) as e:
+                # Batches stay on disk & in memory, so they just get retried next time round
+                bt.logging.error(f"Failed to flush the usage ledger: {e}")
+
+
+usage_ledger = UsageLedger()
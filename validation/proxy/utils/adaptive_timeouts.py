@@ -0,0 +1,127 @@
+"""
+Adaptive timeouts for queries to miners.
+
+Keeps a small streaming latency histogram per (task, uid), plus one per task for uids we haven't heard
+enough from yet, and sets each deadline at a high percentile of them with some headroom.
+The static timeouts are the ceilings, so a hanging miner gets cut off sooner, but never later than it used to be.
+Only organic queries use them: synthetic (scoring) queries keep the static timeouts, so slower but valid miners
+aren't penalised, and stream reads keep theirs too, since a per read deadline would cut off normal pauses.
+"""
+
+import math
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from core import Task
+from models import utility_models
+from validation.models import axon_uid
+from validation.proxy.utils import constants as cst
+
+# Geometric buckets from 10ms to ~3 minutes, each 20% wider than the last
+_SMALLEST_BUCKET = 0.01
+_BUCKET_GROWTH = 1.2
+_BUCKET_BOUNDS: List[float] = [
+    _SMALLEST_BUCKET * _BUCKET_GROWTH**i
+    for i in range(math.ceil(math.log(180 / _SMALLEST_BUCKET, _BUCKET_GROWTH)) + 1)
+]
+
+
+class LatencyHistogram:
+    __slots__ = ("counts", "total")
+
+    def __init__(self) -> None:
+        self.counts: List[int] = [0] * len(_BUCKET_BOUNDS)
+        self.total = 0
+
+    def record(self, latency: float) -> None:
+        index = min(bisect_left(_BUCKET_BOUNDS, latency), len(_BUCKET_BOUNDS) - 1)
+        self.counts[index] += 1
+        self.total += 1
+        if self.total >= cst.LATENCY_HISTOGRAM_MAX_COUNT:
+            self.counts = [count // 2 for count in self.counts]
+            self.total = sum(self.counts)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """Upper bound of the bucket the percentile falls in, so it errs on the generous side"""
+        if self.total == 0:
+            return None
+        target = self.total * percentile / 100
+        cumulative = 0
+        for bound, count in zip(_BUCKET_BOUNDS, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return _BUCKET_BOUNDS[-1]
+
+
+class _Histograms:
+    """One histogram per (task, uid), and one per task as the fallback"""
+
+    def __init__(self) -> None:
+        self.for_uids: Dict[Tuple[Task, axon_uid], LatencyHistogram] = defaultdict(LatencyHistogram)
+        self.for_tasks: Dict[Task, LatencyHistogram] = defaultdict(LatencyHistogram)
+
+    def record(self, task: Task, uid: axon_uid, latency: float) -> None:
+        self.for_uids[(task, uid)].record(latency)
+        self.for_tasks[task].record(latency)
+
+    def get_percentile(self, task: Task, uid: axon_uid, percentile: float) -> Optional[float]:
+        for histogram in (self.for_uids.get((task, uid)), self.for_tasks.get(task)):
+            if histogram is not None and histogram.total >= cst.MIN_LATENCIES_FOR_ADAPTIVE_TIMEOUT:
+                return histogram.percentile(percentile)
+        return None
+
+
+class AdaptiveTimeouts:
+    def __init__(
+        self,
+        percentile: float = cst.ADAPTIVE_TIMEOUT_PERCENTILE,
+        headroom: float = cst.ADAPTIVE_TIMEOUT_HEADROOM,
+        enabled: bool = cst.ADAPTIVE_TIMEOUTS_ENABLED,
+    ) -> None:
+        self.percentile = percentile
+        self.headroom = headroom
+        self.enabled = enabled
+        # Time until the miner starts answering a unary request (first byte)
+        self.response_latencies = _Histograms()
+        self.connect_latencies = _Histograms()
+
+    def record_result(self, query_result: utility_models.QueryResult) -> None:
+        if query_result.axon_uid is None or not query_result.success:
+            return
+        task, uid, timings = query_result.task, query_result.axon_uid, query_result.timings
+
+        # Streams have a time to first token, and their response times don't tell us anything about unary ones
+        if query_result.time_to_first_token is None:
+            if timings is not None and timings.time_to_first_byte is not None:
+                self.response_latencies.record(task, uid, timings.time_to_first_byte)
+            elif query_result.response_time is not None:
+                self.response_latencies.record(task, uid, query_result.response_time)
+
+        # Reused connections don't tell us anything about how long connecting takes
+        if timings is not None and timings.connect:
+            self.connect_latencies.record(task, uid, timings.connect)
+
+    def _get_timeout(
+        self, histograms: _Histograms, task: Task, uid: axon_uid, floor: float, ceiling: float
+    ) -> float:
+        if not self.enabled:
+            return ceiling
+        latency = histograms.get_percentile(task, uid, self.percentile)
+        if latency is None:
+            return ceiling
+        return min(max(latency * self.headroom, floor), ceiling)
+
+    def get_response_timeout(self, task: Task, uid: axon_uid, ceiling: float) -> float:
+        return self._get_timeout(
+            self.response_latencies, task, uid, min(cst.MIN_ADAPTIVE_RESPONSE_TIMEOUT, ceiling), ceiling
+        )
+
+    def get_connect_timeout(self, task: Task, uid: axon_uid, ceiling: float) -> float:
+        return self._get_timeout(
+            self.connect_latencies, task, uid, min(cst.MIN_ADAPTIVE_CONNECT_TIMEOUT, ceiling), ceiling
+        )
+
+
+adaptive_timeouts = AdaptiveTimeouts()
@@ -0,0 +1,111 @@
+"""
+Circuit breakers per (uid, task), so a miner that's gone down stops eating connect timeouts.
+
+closed -> open after a run of consecutive failures. While open, the uid is dropped from organic rotation
+and synthetic requests to it are short circuited (but still recorded as failures, see
+scoring_utils.record_short_circuited_request). After a cool down, one request is let through as a probe
+(half open) - if it succeeds the breaker closes and the uid goes back into rotation, else it re-opens.
+"""
+
+import enum
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import bittensor as bt
+
+from core import Task
+from validation.models import axon_uid
+from validation.proxy.utils import constants as cst
+
+
+class BreakerState(str, enum.Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    __slots__ = ("state", "consecutive_failures", "opened_at", "probe_started_at")
+
+    def __init__(self) -> None:
+        self.state = BreakerState.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started_at: Optional[float] = None
+
+
+BreakerListener = Callable[[Task, axon_uid, BreakerState], None]
+
+
+class CircuitBreakers:
+    def __init__(
+        self,
+        failure_threshold: int = cst.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+        open_seconds: float = cst.CIRCUIT_BREAKER_OPEN_SECONDS,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._breakers: Dict[Tuple[axon_uid, Task], CircuitBreaker] = {}
+        self._listeners: List[BreakerListener] = []
+
+    def add_listener(self, listener: BreakerListener) -> None:
+        self._listeners.append(listener)
+
+    def _set_state(self, task: Task, uid: axon_uid, breaker: CircuitBreaker, state: BreakerState) -> None:
+        if breaker.state == state:
+            return
+        breaker.state = state
+        bt.logging.debug(f"Circuit breaker for uid {uid} and task {task} is now {state.value}")
+        for listener in list(self._listeners):
+            listener(task, uid, state)
+
+    def is_open(self, task: Task, uid: axon_uid) -> bool:
+        breaker = self._breakers.get((uid, task))
+        return breaker is not None and breaker.state != BreakerState.CLOSED
+
+    def allow_request(self, task: Task, uid: axon_uid) -> bool:
+        """Whether a request should actually go out. When half open, this lets exactly one probe through at a time"""
+        breaker = self._breakers.get((uid, task))
+        if breaker is None or breaker.state == BreakerState.CLOSED:
+            return True
+
+        now = time.time()
+        if breaker.state == BreakerState.OPEN:
+            if now - breaker.opened_at < self.open_seconds:
+                return False
+            self._set_state(task, uid, breaker, BreakerState.HALF_OPEN)
+            breaker.probe_started_at = now
+            return True
+
+        # Half open - if the last probe never reported back, let another one go
+        if breaker.probe_started_at is None or now - breaker.probe_started_at >= self.open_seconds:
+            breaker.probe_started_at = now
+            return True
+        return False
+
+    def record_result(self, task: Task, uid: axon_uid, status_code: Optional[int], success: bool) -> None:
+        breaker = self._breakers.get((uid, task))
+        if breaker is None:
+            breaker = CircuitBreaker()
+            self._breakers[(uid, task)] = breaker
+
+        if status_code == 200 and success:
+            breaker.consecutive_failures = 0
+            breaker.probe_started_at = None
+            self._set_state(task, uid, breaker, BreakerState.CLOSED)
+            return
+
+        if status_code == 429:
+            # Rate limited means it's alive, just busy - that's for scoring to deal with, not the breaker
+            return
+
+        breaker.consecutive_failures += 1
+        if breaker.state == BreakerState.HALF_OPEN or (
+            breaker.state == BreakerState.CLOSED and breaker.consecutive_failures >= self.failure_threshold
+        ):
+            breaker.opened_at = time.time()
+            breaker.probe_started_at = None
+            self._set_state(task, uid, breaker, BreakerState.OPEN)
+
+
+circuit_breakers = CircuitBreakers()
@@ -1,6 +1,8 @@
 from datetime import date, datetime, time as dt_time
 from typing import Dict
 
+from core import Task
+
 TESTNET = "testnet"
 
 
@@ -32,6 +34,22 @@ OPERATION_TIMEOUTS: Dict[str, float] = {
     "Chat": 60,
 }
 
+DEFAULT_CONNECT_TIMEOUT = 1.0
+CAPACITY_CONNECT_TIMEOUT = 20
+DEFAULT_STREAM_CONNECT_TIMEOUT = 0.3
+DEFAULT_STREAM_RESPONSE_TIMEOUT = 5  # if X seconds without any data, its boinked
+
+# Adaptive timeouts: a high percentile of each (task, uid)'s recent latencies, with some headroom.
+# The static timeouts above are the ceilings, these are the floors
+ADAPTIVE_TIMEOUTS_ENABLED = True
+ADAPTIVE_TIMEOUT_PERCENTILE = 99
+ADAPTIVE_TIMEOUT_HEADROOM = 1.5
+MIN_LATENCIES_FOR_ADAPTIVE_TIMEOUT = 20
+MIN_ADAPTIVE_RESPONSE_TIMEOUT = 2.0
+MIN_ADAPTIVE_CONNECT_TIMEOUT = 0.2
+# Histogram counts get halved once they reach this, so old latencies fade out
+LATENCY_HISTOGRAM_MAX_COUNT = 1000
+
 # FOR PHASE 1 - where synthetic only validators may have a distribution different to organic ones
 AVAILABLE_TASKS_MULTIPLIER = {
     0: 0,
@@ -49,3 +67,141 @@ AVAILABLE_TASKS_MULTIPLIER = {
     12: 1.4,
     13: 1.5,
 }
+
+# API key cache & rate limiting for the validator api middleware
+API_KEY_CACHE_TTL_SECONDS = 30
+INVALID_API_KEY_CACHE_TTL_SECONDS = 5
+API_KEY_RECONCILE_INTERVAL_SECONDS = 15
+
+# Write-behind usage ledger for api credits & request logs
+USAGE_LEDGER_JOURNAL_PATH = "usage_ledger.journal"
+USAGE_LEDGER_FLUSH_INTERVAL_MS = 500
+USAGE_LEDGER_MAX_BATCH_SIZE = 200
+
+# Organic miner selection
+UID_SELECTION_MODE_LATENCY_AWARE = "latency_aware"
+UID_SELECTION_MODE_ROUND_ROBIN = "round_robin"
+ORGANIC_UID_SELECTION_MODE = UID_SELECTION_MODE_LATENCY_AWARE
+UID_SELECTION_CHOICES = 2  # Power of two choices
+UID_STATS_EWMA_ALPHA = 0.2
+MIN_UID_SUCCESS_RATE = 0.05
+
+# Hedged organic requests: if the first miner hasn't answered by this percentile of recent latencies
+# for the task, fire the same request at a second uid and take whichever good response comes first
+ORGANIC_HEDGING_ENABLED = True
+HEDGE_LATENCY_PERCENTILE = 90
+MIN_LATENCIES_FOR_HEDGING = 20
+TASK_LATENCY_HISTORY_SIZE = 500
+
+# Organic failover: every attempt goes to a fresh uid, and all attempts share one deadline of
+# a single operation timeout plus a small failover budget, rather than each getting a full timeout
+MAX_ORGANIC_ATTEMPTS = 3
+ORGANIC_CONNECT_TIMEOUT = 0.5
+ORGANIC_STREAM_CONNECT_TIMEOUT = 0.3
+ORGANIC_FAILOVER_BUDGET_SECONDS = 3
+MIN_ORGANIC_ATTEMPT_SECONDS = 0.5
+RECENT_FAILURE_WINDOW_SECONDS = 10
+
+# Per (uid, task) circuit breakers, shared by synthetic & organic traffic
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = 5
+CIRCUIT_BREAKER_OPEN_SECONDS = 60
+
+# LLM VOLUMES ARE IN TOKENS,
+# IMAGE VOLUMES ARE IN STEP
+# CLIP IS IN IMAGES
+TASK_TO_VOLUME_TO_REQUESTS_CONVERSION: Dict[Task, float] = {
+    Task.chat_llama_3: 300,
+    Task.chat_mixtral: 300,
+    Task.playground_text_to_image: 50,
+    Task.playground_image_to_image: 50,
+    #
+    Task.chat_llama_3_1_8b: 300,
+    Task.chat_llama_3_1_70b: 300,
+    #
+    Task.proteus_text_to_image: 10,
+    Task.flux_schnell_text_to_image: 25,
+    Task.dreamshaper_text_to_image: 10,
+    #
+    Task.proteus_image_to_image: 10,
+    Task.flux_schnell_image_to_image: 25,
+    Task.dreamshaper_image_to_image: 10,
+    #
+    # Task.upscale: 1,
+    #
+    Task.jugger_inpainting: 20,
+    Task.avatar: 10,
+    Task.clip_image_embeddings: 1,
+}
+
+# Admission control for organic queries
+MIN_ORGANIC_IN_FLIGHT_PER_TASK = 4
+ORGANIC_ADMISSION_QUEUE_SIZE = 64
+ORGANIC_ADMISSION_MAX_WAIT_SECONDS = 5
+ADMISSION_LIMIT_REFRESH_SECONDS = 10
+
+# If a streaming miner hasn't sent its first token within this, we fail over to another uid
+# before anything has gone to the client
+DEFAULT_FIRST_TOKEN_TIMEOUT = 5.0
+TASK_TO_FIRST_TOKEN_TIMEOUT: Dict[Task, float] = {
+    Task.chat_llama_3_1_8b: 2.0,
+    Task.chat_llama_3_1_70b: 4.0,
+    Task.chat_llama_3: 4.0,
+    Task.chat_mixtral: 4.0,
+}
+
+# How many recent responses the dendrite keeps for diagnostics (uid, status, timings, sizes). 0 keeps none
+DENDRITE_RESPONSE_HISTORY_SIZE = 0
+
+# Miner capacity fetching: only uids whose axon or hotkey changed, or whose last capacity is this old, get re-queried
+# (never more than a scoring period)
+CAPACITY_FETCH_CONCURRENCY = 32
+CAPACITY_CACHE_MAX_AGE_SECONDS = 60 * 50
+# Slower axons keep going in the background & land in the cache, rather than holding up the period
+CAPACITY_FETCH_DEADLINE_SECONDS = 30
+
+# Local copy of the metagraph, so a restarted validator can start serving before the chain sync finishes
+METAGRAPH_SNAPSHOT_PATH = "metagraph_snapshot.json"
+
+# Period hand-off: the next period is synced & staged while this long is left of the current one, then swapped in.
+# The finished period's stragglers, scores & weights are seen to in the background
+PERIOD_HANDOFF_LEAD_SECONDS = 60
+# Floor on the time between hand-offs, for when a period is already past its hand-off time
+MIN_SECONDS_BETWEEN_PERIODS = 60
+SYNTHETIC_SCORING_TIMEOUT_SECONDS = 60 * 70
+
+# Checkpoint of the period in progress, so a restarted validator can carry on with it rather than start over
+PERIOD_CHECKPOINT_PATH = "period_checkpoint.json"
+PERIOD_CHECKPOINT_INTERVAL_SECONDS = 60
+PERIOD_CHECKPOINT_MAX_AGE_SECONDS = 60 * 10
+
+# Synthetic queries in flight at once, across all uids & tasks. When it's full the synthetic schedule waits
+MAX_IN_FLIGHT_SYNTHETIC_REQUESTS = 256
+# How long a synthetic request holds its slot waiting for a payload for its task, before it's given up on
+SYNTHETIC_DATA_WAIT_SECONDS = 5
+
+# Global budget for synthetic queries, in requests & payload bytes. The request rate is raised if a period needs more,
+# with headroom so uids can catch up after being throttled
+SYNTHETIC_MAX_REQUESTS_PER_SECOND = 20
+SYNTHETIC_MAX_BYTES_PER_SECOND = 1024 * 1024 * 16
+SYNTHETIC_BUDGET_BURST_SECONDS = 2
+SYNTHETIC_BUDGET_CATCH_UP_HEADROOM = 2
+SYNTHETIC_BUDGET_MAX_SLEEP_SECONDS = 0.5
+# Synthetic queries slow down in proportion to how far past these organic load & event loop lag are
+SYNTHETIC_THROTTLE_ORGANIC_IN_FLIGHT = 32
+SYNTHETIC_THROTTLE_LOOP_LAG_SECONDS = 0.05
+MIN_SYNTHETIC_RATE_FACTOR = 0.1
+LOOP_LAG_CHECK_INTERVAL_SECONDS = 0.25
+
+# Ready made synthetic payloads kept per task, & how they're topped up from the orchestrator
+SYNTHETIC_PAYLOAD_POOL_SIZE = 16
+SYNTHETIC_REFILL_BATCH_SIZE = 4
+SYNTHETIC_REFILL_INTERVAL_SECONDS = 3
+# At startup, tasks with no payloads yet are retried quickly for up to this long, then left to the usual refill
+SYNTHETIC_INITIAL_FETCH_SECONDS = 60
+# Skip the orchestrator entirely & only use locally made synthetic data, e.g. for benchmarking offline
+LOCAL_SYNTHETIC_DATA_ONLY = False
+
+# Altered copies of the avatar init image are made by patching its encoded jpeg: a few quantisation table entries
+# get nudged, and a random nonce goes in a comment segment
+QUANTISATION_ENTRIES_TO_PERTURB = 3
+JPEG_NONCE_LENGTH = 6
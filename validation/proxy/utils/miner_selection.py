@@ -0,0 +1,105 @@
+"""
+Latency & success aware selection of uids for organic queries.
+
+Keeps an EWMA of latency, time to first token (for streams) and error rate per (task, uid), fed from
+every QueryResult, synthetic and organic. Picking is power-of-two-choices: the caller pulls a couple
+of candidates off the front of the round robin queue, and we pick whichever looks best.
+"""
+
+import math
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional
+
+from core import Task
+from models import utility_models
+from validation.models import axon_uid
+from validation.proxy.utils import constants as cst
+
+
+class UIDStats:
+    __slots__ = ("latency", "time_to_first_token", "error_rate", "last_failure_time")
+
+    def __init__(self) -> None:
+        self.latency: Optional[float] = None
+        self.time_to_first_token: Optional[float] = None
+        self.error_rate: float = 0.0
+        self.last_failure_time: Optional[float] = None
+
+
+def _ewma(current: Optional[float], new_value: float, alpha: float) -> float:
+    if current is None:
+        return new_value
+    return alpha * new_value + (1 - alpha) * current
+
+
+class MinerSelector:
+    def __init__(self, alpha: float = cst.UID_STATS_EWMA_ALPHA) -> None:
+        self.alpha = alpha
+        self.task_to_uid_stats: Dict[Task, Dict[axon_uid, UIDStats]] = defaultdict(dict)
+        self.task_to_recent_latencies: Dict[Task, Deque[float]] = defaultdict(
+            lambda: deque(maxlen=cst.TASK_LATENCY_HISTORY_SIZE)
+        )
+
+    def record_result(self, query_result: utility_models.QueryResult) -> None:
+        if query_result.axon_uid is None:
+            return
+        uid_stats = self.task_to_uid_stats[query_result.task]
+        stats = uid_stats.get(query_result.axon_uid)
+        if stats is None:
+            stats = UIDStats()
+            uid_stats[query_result.axon_uid] = stats
+
+        if query_result.success:
+            stats.error_rate = _ewma(stats.error_rate, 0.0, self.alpha)
+            if query_result.response_time is not None:
+                stats.latency = _ewma(stats.latency, query_result.response_time, self.alpha)
+                self.task_to_recent_latencies[query_result.task].append(query_result.response_time)
+            if query_result.time_to_first_token is not None:
+                stats.time_to_first_token = _ewma(
+                    stats.time_to_first_token, query_result.time_to_first_token, self.alpha
+                )
+        else:
+            stats.error_rate = _ewma(stats.error_rate, 1.0, self.alpha)
+            stats.last_failure_time = time.time()
+
+    def recently_failed(
+        self, task: Task, uid: axon_uid, window_seconds: float = cst.RECENT_FAILURE_WINDOW_SECONDS
+    ) -> bool:
+        stats = self.task_to_uid_stats[task].get(uid)
+        return (
+            stats is not None
+            and stats.last_failure_time is not None
+            and time.time() - stats.last_failure_time < window_seconds
+        )
+
+    def get_latency_percentile(self, task: Task, percentile: float, min_samples: int = 1) -> Optional[float]:
+        """Percentile of the recent successful latencies across all uids for the task"""
+        recent_latencies = self.task_to_recent_latencies.get(task)
+        if recent_latencies is None or len(recent_latencies) < max(min_samples, 1):
+            return None
+        sorted_latencies = sorted(recent_latencies)
+        index = min(math.ceil(len(sorted_latencies) * percentile / 100) - 1, len(sorted_latencies) - 1)
+        return sorted_latencies[max(index, 0)]
+
+    def _get_expected_cost(self, task: Task, uid: axon_uid) -> float:
+        """Lower is better. Roughly 'expected latency, inflated by how often you fail'"""
+        stats = self.task_to_uid_stats[task].get(uid)
+        if stats is None:
+            # Never seen it, so give it a go to learn something
+            return 0.0
+
+        latency = stats.time_to_first_token if stats.time_to_first_token is not None else stats.latency
+        success_rate = max(1 - stats.error_rate, cst.MIN_UID_SUCCESS_RATE)
+        if latency is None:
+            # Has only ever failed - rank behind anything that's succeeded
+            return float("inf") if stats.error_rate > 0 else 0.0
+        return latency / success_rate
+
+    def pick_best_uid(self, task: Task, candidate_uids: List[axon_uid]) -> Optional[axon_uid]:
+        if not candidate_uids:
+            return None
+        return min(candidate_uids, key=lambda uid: self._get_expected_cost(task, uid))
+
+
+miner_selector = MinerSelector()
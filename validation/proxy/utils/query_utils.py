@@ -1,16 +1,17 @@
 import asyncio
 import time
-from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+from typing import AsyncIterator, List, Optional, Tuple
 from pydantic import BaseModel, ValidationError
-from core import Task
+from core import Task, sse as core_sse
 from models import base_models, utility_models
 import bittensor as bt
-from validation.proxy.utils import constants as cst
+from validation.proxy.utils import constants as cst, sse
 from validation.models import UIDRecord, axon_uid
 from core import bittensor_overrides as bto
 from collections import OrderedDict
 from validation.scoring import scoring_utils
-import ujson as json
+from validation.proxy.utils.miner_selection import miner_selector
+from validation.proxy.utils.adaptive_timeouts import adaptive_timeouts
 
 
 class UIDQueue:
@@ -55,6 +56,10 @@ async def query_individual_axon(
     synapse: bt.Synapse,
     deserialize: bool = False,
     log_requests_and_responses: bool = True,
+    connect_timeout: Optional[float] = None,
+    response_timeout: Optional[float] = None,
+    synthetic_query: bool = False,
+    request_timer: Optional[bto.RequestPhaseTimer] = None,
 ) -> Tuple[base_models.BaseSynapse, float]:
     operation_name = synapse.__class__.__name__
     if operation_name not in cst.OPERATION_TIMEOUTS:
@@ -70,55 +75,28 @@ async def query_individual_axon(
     response = await dendrite.forward(
         axons=axon,
         synapse=synapse,
-        connect_timeout=1.0 if operation_name != "Capacity" else 20,
-        response_timeout=cst.OPERATION_TIMEOUTS.get(operation_name, 15),
+        connect_timeout=connect_timeout
+        or (cst.DEFAULT_CONNECT_TIMEOUT if operation_name != "Capacity" else cst.CAPACITY_CONNECT_TIMEOUT),
+        response_timeout=response_timeout or cst.OPERATION_TIMEOUTS.get(operation_name, 15),
         deserialize=deserialize,
         log_requests_and_responses=log_requests_and_responses,
         streaming=False,
+        pool=bto.get_pool_name(synthetic_query=synthetic_query, streaming=False),
+        request_timer=request_timer,
     )
     return response, time.time() - start_time
 
 
-def _load_sse_jsons(chunk: str) -> Union[List[Dict[str, Any]], Dict[str, str]]:
-    try:
-        jsons = []
-        received_event_chunks = chunk.split("\n\n")
-        for event in received_event_chunks:
-            if event == "":
-                continue
-            prefix, _, data = event.partition(":")
-            if data.strip() == "[DONE]":
-                break
-            loaded_chunk = json.loads(data)
-            jsons.append(loaded_chunk)
-        return jsons
-    except json.JSONDecodeError:
-        try:
-            loaded_chunk = json.loads(chunk)
-            if "message" in loaded_chunk:
-                return {
-                    "message": loaded_chunk["message"],
-                    "status_code": "429" if "bro" in loaded_chunk["message"] else "500",
-                }
-        except json.JSONDecodeError:
-            ...
-
-    return []
-
-
-def _get_formatted_payload(content: str, first_message: bool, add_finish_reason: bool = False) -> str:
-    delta_payload = {"content": content}
-    if first_message:
-        delta_payload["role"] = "assistant"
-    choices_payload = {"delta": delta_payload}
-    if add_finish_reason:
-        choices_payload["finish_reason"] = "stop"
-    payload = {
-        "choices": [choices_payload],
-    }
-
-    dumped_payload = json.dumps(payload)
-    return dumped_payload
+async def _iterate_sse_events(chunk_generator: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Complete events only, however the network happened to chunk them"""
+    parser = core_sse.SSEParser()
+    async for chunk in chunk_generator:
+        if isinstance(chunk, bytes):
+            for event in parser.feed(chunk):
+                yield event
+    leftover = parser.flush()
+    if leftover.strip():
+        yield leftover
 
 
 async def query_miner_stream(
@@ -128,45 +106,64 @@ async def query_miner_stream(
     task: Task,
     dendrite: bto.dendrite,
     synthetic_query: bool,
-) -> AsyncIterator[str]:
+    connect_timeout: Optional[float] = None,
+    response_timeout: Optional[float] = None,
+) -> AsyncIterator[bytes]:
     axon_uid = uid_record.axon_uid
     axon = uid_record.axon
 
+    # Only organic streams get an adaptive connect timeout - synthetic ones are for scoring, so they keep the static
+    # ones. The response timeout is per read, so adapting it would cut off streams that just pause for a bit
+    if not synthetic_query:
+        connect_timeout = adaptive_timeouts.get_connect_timeout(
+            task, axon_uid, ceiling=connect_timeout or cst.DEFAULT_STREAM_CONNECT_TIMEOUT
+        )
+
     time1 = time.time()
+    request_timer = bto.RequestPhaseTimer()
     text_generator = await query_individual_axon_stream(
-        synapse=synapse, dendrite=dendrite, axon=axon, axon_uid=axon_uid, log_requests_and_responses=False
+        synapse=synapse,
+        dendrite=dendrite,
+        axon=axon,
+        axon_uid=axon_uid,
+        log_requests_and_responses=False,
+        connect_timeout=connect_timeout,
+        response_timeout=response_timeout,
+        synthetic_query=synthetic_query,
+        request_timer=request_timer,
     )
-    text_jsons = []
+    raw_payloads: List[bytes] = []
     status_code = 200
     error_message = None
+    time_to_first_token = None
     if text_generator is not None:
         first_message = True
-        async for text in text_generator:
-            if isinstance(text, str):
-                try:
-                    loaded_jsons = _load_sse_jsons(text)
-                    if isinstance(loaded_jsons, dict):
-                        status_code = loaded_jsons.get("status_code")
-                        error_message = loaded_jsons.get("message")
-                        break
-
-                except (IndexError, json.JSONDecodeError) as e:
-                    bt.logging.warning(f"Error {e} when trying to load text: {text}")
+        async for event in _iterate_sse_events(text_generator):
+            data = sse.get_event_data(event)
+            if data is None:
+                loaded_error = sse.load_error_message(event)
+                if loaded_error is not None:
+                    status_code = loaded_error.get("status_code")
+                    error_message = loaded_error.get("message")
                     break
+                bt.logging.warning(f"Unexpected chunk from the miner, it's not an event: {event[:200]}")
+                continue
+            if not data or data == sse.DONE:
+                continue
+            raw_payloads.append(data)
 
-                text_jsons.extend(loaded_jsons)
-                for text_json in loaded_jsons:
-                    content = text_json.get("text", "")
-                    if content == "":
-                        continue
-                    dumped_payload = _get_formatted_payload(content, first_message)
-                    first_message = False
-                    yield f"data: {dumped_payload}\n\n"
+            content_literal = sse.extract_json_string_field(data)
+            if content_literal is None or sse.is_empty_string_literal(content_literal):
+                continue
+            if first_message:
+                time_to_first_token = time.time() - time1
+            yield sse.format_delta_event(content_literal, first_message)
+            first_message = False
 
+        text_jsons = sse.load_payloads(raw_payloads)
         if len(text_jsons) > 0:
-            last_payload = _get_formatted_payload("", False, add_finish_reason=True)
-            yield f"data: {last_payload}\n\n"
-            yield "data: [DONE]\n\n"
+            yield sse.FINISH_EVENT
+            yield sse.DONE_EVENT
             bt.logging.info(f"✅ Successfully queried axon: {axon_uid} for task: {task}")
 
         response_time = time.time() - time1
@@ -179,6 +176,8 @@ async def query_miner_stream(
             miner_hotkey=uid_record.hotkey,
             status_code=status_code,
             error_message=error_message,
+            time_to_first_token=time_to_first_token,
+            timings=utility_models.RequestTimings(**request_timer.to_dict()),
         )
 
         create_scoring_adjustment_task(query_result, synapse, uid_record, synthetic_query)
@@ -187,6 +186,8 @@ async def query_miner_stream(
 def create_scoring_adjustment_task(
     query_result: utility_models.QueryResult, synapse: bt.Synapse, uid_record: UIDRecord, synthetic_query: bool
 ):
+    miner_selector.record_result(query_result)
+    adaptive_timeouts.record_result(query_result)
     asyncio.create_task(
         scoring_utils.adjust_uid_record_from_result(query_result, synapse, uid_record, synthetic_query=synthetic_query)
     )
@@ -199,16 +200,37 @@ async def query_miner_no_stream(
     task: Task,
     dendrite: bto.dendrite,
     synthetic_query: bool,
+    connect_timeout: Optional[float] = None,
+    response_timeout: Optional[float] = None,
 ) -> utility_models.QueryResult:
     axon_uid = uid_record.axon_uid
     axon = uid_record.axon
+    # Synthetic queries are for scoring, so they keep the static timeouts: a slow but valid miner mustn't be
+    # penalised for being slower than its peers. Adaptive ones only cut organic users' waits short
+    if not synthetic_query:
+        connect_timeout = adaptive_timeouts.get_connect_timeout(
+            task, axon_uid, ceiling=connect_timeout or cst.DEFAULT_CONNECT_TIMEOUT
+        )
+        response_timeout = adaptive_timeouts.get_response_timeout(
+            task, axon_uid, ceiling=response_timeout or cst.OPERATION_TIMEOUTS.get(synapse.__class__.__name__, 15)
+        )
+    request_timer = bto.RequestPhaseTimer()
     resulting_synapse, response_time = await query_individual_axon(
-        synapse=synapse, dendrite=dendrite, axon=axon, axon_uid=axon_uid, log_requests_and_responses=False
+        synapse=synapse,
+        dendrite=dendrite,
+        axon=axon,
+        axon_uid=axon_uid,
+        log_requests_and_responses=False,
+        connect_timeout=connect_timeout,
+        response_timeout=response_timeout,
+        synthetic_query=synthetic_query,
+        request_timer=request_timer,
     )
 
     # IDE doesn't recognise the above typehints, idk why? :-(
     resulting_synapse: base_models.BaseSynapse
     response_time: float
+    timings = utility_models.RequestTimings(**request_timer.to_dict())
 
     formatted_response = get_formatted_response(resulting_synapse, outgoing_model)
     if formatted_response is not None:
@@ -222,6 +244,7 @@ async def query_miner_no_stream(
             miner_hotkey=uid_record.hotkey,
             status_code=resulting_synapse.axon.status_code,
             error_message=resulting_synapse.error_message,
+            timings=timings,
         )
         create_scoring_adjustment_task(query_result, synapse, uid_record, synthetic_query)
         return query_result
@@ -236,6 +259,7 @@ async def query_miner_no_stream(
             miner_hotkey=uid_record.hotkey,
             status_code=resulting_synapse.axon.status_code,
             error_message=resulting_synapse.error_message,
+            timings=timings,
         )
         create_scoring_adjustment_task(query_result, synapse, uid_record, synthetic_query)
 
@@ -249,6 +273,7 @@ async def query_miner_no_stream(
             status_code=resulting_synapse.axon.status_code,
             success=False,
             miner_hotkey=uid_record.hotkey,
+            timings=timings,
         )
         create_scoring_adjustment_task(query_result, synapse, uid_record, synthetic_query)
         return query_result
@@ -279,6 +304,10 @@ async def query_individual_axon_stream(
     synapse: bt.Synapse,
     deserialize: bool = False,
     log_requests_and_responses: bool = True,
+    connect_timeout: Optional[float] = None,
+    response_timeout: Optional[float] = None,
+    synthetic_query: bool = False,
+    request_timer: Optional[bto.RequestPhaseTimer] = None,
 ):
     synapse_name = synapse.__class__.__name__
     if synapse_name not in cst.OPERATION_TIMEOUTS:
@@ -288,10 +317,12 @@ async def query_individual_axon_stream(
     response = await dendrite.forward(
         axons=axon,
         synapse=synapse,
-        connect_timeout=0.3,
-        response_timeout=5,  # if X seconds without any data, its boinked
+        connect_timeout=connect_timeout or cst.DEFAULT_STREAM_CONNECT_TIMEOUT,
+        response_timeout=response_timeout or cst.DEFAULT_STREAM_RESPONSE_TIMEOUT,
         deserialize=deserialize,
         log_requests_and_responses=log_requests_and_responses,
         streaming=True,
+        pool=bto.get_pool_name(synthetic_query=synthetic_query, streaming=True),
+        request_timer=request_timer,
     )
     return response
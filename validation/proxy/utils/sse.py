@@ -0,0 +1,111 @@
+"""
+Byte level handling of the miners' chat SSE streams, for passing them straight through to the client.
+
+Miners send events like `data: {"text": "...", "logprob": -0.1}`. Rather than json.loads every event, then
+json.dumps a new payload for every token, we find the raw (still json encoded) `text` string literal in the
+event, and splice it into pre-encoded byte templates of the OpenAI style delta envelope.
+The raw event payloads are kept so they can be parsed in one go at the end, for scoring.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import ujson as json
+
+DATA_PREFIX = b"data:"
+DONE = b"[DONE]"
+
+_TEXT_KEY = b'"text"'
+_EMPTY_STRING_LITERAL = b'""'
+
+# Same bytes as json.dumps({"choices": [{"delta": {"content": ..., "role": "assistant"}}]}) used to give us
+_FIRST_DELTA_PREFIX = b'data: {"choices":[{"delta":{"content":'
+_FIRST_DELTA_SUFFIX = b',"role":"assistant"}}]}\n\n'
+_DELTA_PREFIX = b'data: {"choices":[{"delta":{"content":'
+_DELTA_SUFFIX = b"}}]}\n\n"
+
+FINISH_EVENT = b'data: {"choices":[{"delta":{"content":""},"finish_reason":"stop"}]}\n\n'
+DONE_EVENT = b"data: [DONE]\n\n"
+
+
+def get_event_data(event: bytes) -> Optional[bytes]:
+    """The payload of a `data:` event, or None if it isn't one"""
+    event = event.strip()
+    if not event.startswith(DATA_PREFIX):
+        return None
+    return event[len(DATA_PREFIX) :].strip()
+
+
+def extract_json_string_field(data: bytes, key: bytes = _TEXT_KEY) -> Optional[bytes]:
+    """
+    Finds the raw json string literal (quotes and escapes included) for a top level key, without decoding anything.
+    e.g. b'{"text":"hi \\"you\\"","logprob":-0.1}' -> b'"hi \\"you\\""'
+    """
+    key_index = data.find(key)
+    if key_index == -1:
+        return None
+
+    position = key_index + len(key)
+    length = len(data)
+    while position < length and data[position] in b" \t":
+        position += 1
+    if position >= length or data[position] != ord(":"):
+        return None
+    position += 1
+    while position < length and data[position] in b" \t":
+        position += 1
+    if position >= length or data[position] != ord('"'):
+        return None
+
+    start = position
+    position += 1
+    while True:
+        position = data.find(b'"', position)
+        if position == -1:
+            return None
+        # A quote is escaped only if it's preceded by an odd number of backslashes
+        backslashes = 0
+        while data[position - 1 - backslashes] == ord("\\"):
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return data[start : position + 1]
+        position += 1
+
+
+def is_empty_string_literal(string_literal: bytes) -> bool:
+    return string_literal == _EMPTY_STRING_LITERAL
+
+
+def format_delta_event(content_literal: bytes, first_message: bool) -> bytes:
+    if first_message:
+        return _FIRST_DELTA_PREFIX + content_literal + _FIRST_DELTA_SUFFIX
+    return _DELTA_PREFIX + content_literal + _DELTA_SUFFIX
+
+
+def load_error_message(chunk: bytes) -> Optional[Dict[str, str]]:
+    """Miners that reject a request send back a plain json body with a message, not an event stream"""
+    try:
+        loaded_chunk = json.loads(chunk)
+    except ValueError:
+        return None
+    if isinstance(loaded_chunk, dict) and "message" in loaded_chunk:
+        return {
+            "message": loaded_chunk["message"],
+            "status_code": "429" if "bro" in loaded_chunk["message"] else "500",
+        }
+    return None
+
+
+def load_payloads(payloads: List[bytes]) -> List[Dict[str, Any]]:
+    """Parses all the payloads kept for scoring in one go, only falling back to one at a time if some are broken"""
+    if not payloads:
+        return []
+    try:
+        return json.loads(b"[" + b",".join(payloads) + b"]")
+    except ValueError:
+        loaded_payloads = []
+        for payload in payloads:
+            try:
+                loaded_payloads.append(json.loads(payload))
+            except ValueError:
+                continue
+        return loaded_payloads
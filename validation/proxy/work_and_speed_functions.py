@@ -1,6 +1,6 @@
 import ujson as json
 import math
-from typing import Dict, Any, List, Union
+from typing import Dict, Any, List, Optional, Union
 
 from core import Task
 from core import tasks
@@ -10,6 +10,17 @@ import bittensor as bt
 
 MAX_SPEED_BONUS = 1.6  # Adjust this value as needed
 CHARACTER_TO_TOKEN_CONVERSION = 4.0
+# Time spent in these phases is down to the validator or the distance to the miner, not the miner itself
+PHASES_NOT_SCORED_FOR_SPEED = ("pool_wait", "dns", "connect")
+
+
+def _get_miner_response_time(result: Dict[str, Any]) -> Optional[float]:
+    response_time = result.get("response_time")
+    if response_time is None:
+        return None
+    timings = result.get("timings") or {}
+    time_not_on_the_miner = sum(timings.get(phase) or 0 for phase in PHASES_NOT_SCORED_FOR_SPEED)
+    return max(response_time - time_not_on_the_miner, 0)
 
 
 def _calculate_speed_modifier(time_per_unit: float, config: TaskConfig) -> float:
@@ -55,7 +66,7 @@ def _calculate_work_clip(number_of_images: int) -> float:
 def calculate_speed_modifier(task: Task, result: Dict[str, Any], synapse: Dict[str, Any]) -> float:
     config = tasks.get_task_config(task)
 
-    response_time = result.get("response_time")
+    response_time = _get_miner_response_time(result)
     raw_formatted_response = result.get("formatted_response")
 
     if response_time is None or raw_formatted_response is None:
@@ -3,6 +3,7 @@ from validation.models import UIDRecord
 from validation.proxy import work_and_speed_functions
 from models import utility_models
 from validation.db.db_management import db_manager
+from validation.proxy.utils.circuit_breaker import circuit_breakers
 
 
 async def adjust_uid_record_from_result(
@@ -12,6 +13,12 @@ async def adjust_uid_record_from_result(
 
     uid_record.total_requests_made += 1
 
+    # Results without an axon uid are bookkeeping for failovers, the real result was already recorded
+    if query_result.axon_uid is not None:
+        circuit_breakers.record_result(
+            uid_record.task, uid_record.axon_uid, query_result.status_code, query_result.success
+        )
+
     # Important we dont make the below adjustment here, since we need to make it elsewhere
     # uid_record.synthetic_requests_still_to_make -= 1
 
@@ -28,3 +35,12 @@ async def adjust_uid_record_from_result(
     else:
         uid_record.requests_500 += 1
     return query_result
+
+
+def record_short_circuited_request(uid_record: UIDRecord) -> None:
+    """
+    For synthetic requests we didn't send because the uid's circuit breaker is open.
+    Each one counts as a failed (500) request, the same as if it had been sent & failed again
+    """
+    uid_record.total_requests_made += 1
+    uid_record.requests_500 += 1
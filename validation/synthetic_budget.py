@@ -0,0 +1,115 @@
+"""
+Global budget for synthetic queries, so they can't crowd out organic ones.
+
+Two token buckets, one in requests and one in payload bytes, shared by every synthetic query the validator makes.
+Both refill more slowly while organic queries are piling up or the event loop is lagging, and go back to full
+speed once things calm down. Uids don't lose out from being slowed down: the scheduler spreads each uid's
+remaining requests over the time left in the period, so they catch up again after.
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, Optional
+
+import bittensor as bt
+
+from validation.proxy.utils import constants as cst
+
+
+def estimate_payload_bytes(synthetic_data: Dict[str, Any]) -> int:
+    """Near enough, without encoding anything: the strings (prompts, base64 images) are nearly all of it"""
+    payload_bytes = 0
+    for value in synthetic_data.values():
+        if isinstance(value, (str, bytes)):
+            payload_bytes += len(value)
+        elif isinstance(value, list):
+            payload_bytes += sum(len(item) if isinstance(item, (str, bytes)) else 16 for item in value)
+        else:
+            payload_bytes += 16
+    return payload_bytes
+
+
+class _TokenBucket:
+    __slots__ = ("rate", "burst_seconds", "tokens", "updated_at", "lock")
+
+    def __init__(self, rate: float, burst_seconds: float) -> None:
+        self.rate = rate
+        self.burst_seconds = burst_seconds
+        self.tokens = rate * burst_seconds
+        self.updated_at = time.monotonic()
+        # Waiters queue up behind the lock, so they're served in order
+        self.lock = asyncio.Lock()
+
+    def refill(self, rate_factor: float) -> None:
+        now = time.monotonic()
+        capacity = self.rate * self.burst_seconds
+        self.tokens = min(self.tokens + (now - self.updated_at) * self.rate * rate_factor, capacity)
+        self.updated_at = now
+
+    async def take(self, amount: float, get_rate_factor: Callable[[], float]) -> None:
+        async with self.lock:
+            while True:
+                rate_factor = get_rate_factor()
+                self.refill(rate_factor)
+                # Anything bigger than the whole bucket goes through on a full bucket, and leaves it in debt
+                if self.tokens >= min(amount, self.rate * self.burst_seconds):
+                    self.tokens -= amount
+                    return
+                shortfall = min(amount, self.rate * self.burst_seconds) - self.tokens
+                # Capped, so a change in the throttle gets picked up
+                await asyncio.sleep(min(shortfall / (self.rate * rate_factor), cst.SYNTHETIC_BUDGET_MAX_SLEEP_SECONDS))
+
+
+class SyntheticBudget:
+    def __init__(
+        self,
+        get_organic_in_flight: Callable[[], int],
+        requests_per_second: float = cst.SYNTHETIC_MAX_REQUESTS_PER_SECOND,
+        bytes_per_second: float = cst.SYNTHETIC_MAX_BYTES_PER_SECOND,
+    ) -> None:
+        self.get_organic_in_flight = get_organic_in_flight
+        self.min_requests_per_second = requests_per_second
+        self._requests = _TokenBucket(requests_per_second, cst.SYNTHETIC_BUDGET_BURST_SECONDS)
+        self._bytes = _TokenBucket(bytes_per_second, cst.SYNTHETIC_BUDGET_BURST_SECONDS)
+        self.loop_lag = 0.0
+        self._lag_monitor: Optional[asyncio.Task] = None
+
+    def set_required_request_rate(self, requests_per_second: float) -> None:
+        """Makes sure the budget has room for what the period needs, with headroom to catch up after throttling"""
+        self._requests.rate = max(
+            self.min_requests_per_second, requests_per_second * cst.SYNTHETIC_BUDGET_CATCH_UP_HEADROOM
+        )
+
+    def get_rate_factor(self) -> float:
+        """1 when things are quiet, scaled down in proportion to how far organic load & loop lag are over the line"""
+        rate_factor = 1.0
+        organic_in_flight = self.get_organic_in_flight()
+        if organic_in_flight > cst.SYNTHETIC_THROTTLE_ORGANIC_IN_FLIGHT:
+            rate_factor *= cst.SYNTHETIC_THROTTLE_ORGANIC_IN_FLIGHT / organic_in_flight
+        if self.loop_lag > cst.SYNTHETIC_THROTTLE_LOOP_LAG_SECONDS:
+            rate_factor *= cst.SYNTHETIC_THROTTLE_LOOP_LAG_SECONDS / self.loop_lag
+        return max(rate_factor, cst.MIN_SYNTHETIC_RATE_FACTOR)
+
+    async def acquire_request(self) -> None:
+        self._start_lag_monitor()
+        await self._requests.take(1, self.get_rate_factor)
+
+    async def acquire_bytes(self, payload_bytes: int) -> None:
+        self._start_lag_monitor()
+        await self._bytes.take(payload_bytes, self.get_rate_factor)
+
+    def _start_lag_monitor(self) -> None:
+        if self._lag_monitor is None or self._lag_monitor.done():
+            self._lag_monitor = asyncio.create_task(self._monitor_loop_lag())
+
+    async def _monitor_loop_lag(self) -> None:
+        """How late a short sleep wakes up is how long everything else is waiting for the loop"""
+        interval = cst.LOOP_LAG_CHECK_INTERVAL_SECONDS
+        while True:
+            started_at = time.monotonic()
+            await asyncio.sleep(interval)
+            lag = max(time.monotonic() - started_at - interval, 0.0)
+            # Jumps straight up, eases back down
+            self.loop_lag = max(lag, self.loop_lag * 0.5)
+            if lag > cst.SYNTHETIC_THROTTLE_LOOP_LAG_SECONDS:
+                bt.logging.debug(f"Event loop lagging by {lag:.3f}s, throttling synthetic queries")
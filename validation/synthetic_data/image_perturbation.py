@@ -0,0 +1,91 @@
+"""
+Slightly altered copies of an image, made by patching its already encoded bytes.
+
+Synthetic payloads with a fixed init image get altered every time, so miners can't just cache the response.
+Rather than decode, tweak & re-encode the whole image per request, it's encoded as a jpeg (and base64) once,
+and each variant patches a few bytes of that:
+- a couple of the high frequency quantisation table entries are nudged, so the decoded pixels come out
+  slightly different, and
+- a random nonce goes in a comment segment, so no two variants are byte for byte the same.
+Patching a byte of the jpeg only changes the 4 base64 characters around it, so only those are re-encoded.
+"""
+
+import io
+import os
+import random
+from typing import Dict, List
+
+import pybase64 as base64
+from PIL import Image
+
+from validation.proxy.utils import constants as cst
+
+_START_OF_IMAGE = b"\xff\xd8"
+_COMMENT_MARKER = 0xFE
+_QUANTISATION_TABLE_MARKER = 0xDB
+_START_OF_SCAN_MARKER = 0xDA
+# Zigzag positions from here on are the high frequencies, where nudging the quantisation is least visible
+_FIRST_HIGH_FREQUENCY_POSITION = 32
+
+
+def _get_quantisation_entry_offsets(jpeg: bytes) -> List[int]:
+    """Offsets of the high frequency entries of every 8 bit quantisation table"""
+    offsets = []
+    position = len(_START_OF_IMAGE)
+    while position + 4 <= len(jpeg) and jpeg[position] == 0xFF:
+        marker = jpeg[position + 1]
+        if marker == 0xFF:
+            # Fill byte
+            position += 1
+            continue
+        if marker == _START_OF_SCAN_MARKER:
+            break
+        segment_length = int.from_bytes(jpeg[position + 2 : position + 4], "big")
+        if marker == _QUANTISATION_TABLE_MARKER:
+            table_position = position + 4
+            segment_end = position + 2 + segment_length
+            while table_position < segment_end:
+                is_16_bit = jpeg[table_position] >> 4
+                table_position += 1
+                if not is_16_bit:
+                    offsets.extend(range(table_position + _FIRST_HIGH_FREQUENCY_POSITION, table_position + 64))
+                table_position += 128 if is_16_bit else 64
+        position += 2 + segment_length
+    return offsets
+
+
+class PerturbedJpeg:
+    def __init__(
+        self,
+        image: Image.Image,
+        quantisation_entries_to_perturb: int = cst.QUANTISATION_ENTRIES_TO_PERTURB,
+        nonce_length: int = cst.JPEG_NONCE_LENGTH,
+    ) -> None:
+        buffered = io.BytesIO()
+        image.convert("RGB").save(buffered, format="JPEG")
+        encoded = buffered.getvalue()
+
+        # An empty comment segment straight after the start of image marker, for the nonce to go in
+        comment_segment = bytes([0xFF, _COMMENT_MARKER]) + (2 + nonce_length).to_bytes(2, "big")
+        nonce_offset = len(_START_OF_IMAGE) + len(comment_segment)
+        self._jpeg = _START_OF_IMAGE + comment_segment + bytes(nonce_length) + encoded[len(_START_OF_IMAGE) :]
+        self._b64 = base64.b64encode(self._jpeg)
+
+        self._nonce_offsets = range(nonce_offset, nonce_offset + nonce_length)
+        self._quantisation_offsets = _get_quantisation_entry_offsets(self._jpeg)
+        self.quantisation_entries_to_perturb = min(quantisation_entries_to_perturb, len(self._quantisation_offsets))
+
+    def get_variant(self) -> str:
+        patches: Dict[int, int] = dict(zip(self._nonce_offsets, os.urandom(len(self._nonce_offsets))))
+        for offset in random.sample(self._quantisation_offsets, self.quantisation_entries_to_perturb):
+            patches[offset] = min(max(self._jpeg[offset] + random.choice((-1, 1)), 1), 255)
+
+        variant = bytearray(self._b64)
+        for group_start in {offset - offset % 3 for offset in patches}:
+            group = bytearray(self._jpeg[group_start : group_start + 3])
+            for offset in range(group_start, group_start + len(group)):
+                if offset in patches:
+                    group[offset - group_start] = patches[offset]
+            b64_start = group_start // 3 * 4
+            variant[b64_start : b64_start + 4] = base64.b64encode(bytes(group))
+        return variant.decode()
@@ -0,0 +1,204 @@
+"""
+Synthetic payloads made locally, with no network round trips.
+
+Used whenever the orchestrator's synthetic data hasn't turned up (slow, down, or we're benchmarking offline), so
+synthetic querying never has to wait on it. Prompts & conversations come from small templated corpora below,
+and everything is drawn from the rng passed in, so a seeded rng gives the same payloads every time - bar the
+avatar init image, which is a fresh perturbed copy of the postie every time so miners can't cache it.
+"""
+
+import functools
+import io
+import random
+from typing import Any, Callable, Dict, List
+
+import pybase64 as base64
+from PIL import Image, ImageDraw
+
+from core import Task, constants as core_cst, dataclasses as dc
+from core import utils as core_utils
+from models import base_models, utility_models
+from validation.synthetic_data import image_perturbation
+
+POSTIE_PATH = "validation/synthetic_data/postie.png"
+
+_SUBJECTS = ['an old lighthouse', 'a red fox', 'a robot chef', 'a mountain village', 'a vintage car', 'a koi pond', 'an astronaut', 'a street market', 'a dragon', 'a tea house', 'a sailing ship', 'a snowy owl']  # fmt: off
+_SETTINGS = ['at sunrise', 'under a starry sky', 'in heavy rain', 'in a misty forest', 'on a busy street', 'by the sea', 'in the desert', 'in autumn', 'in a neon city', 'in a quiet library']  # fmt: off
+_STYLES = ['photorealistic', 'watercolor painting', 'oil painting', 'pixel art', 'studio ghibli style', 'pencil sketch', 'cinematic lighting', 'isometric 3d render', 'art deco poster', 'low poly']  # fmt: off
+_DETAILS = ['highly detailed', 'soft light', 'vibrant colours', 'shallow depth of field', 'wide angle', 'muted tones', 'dramatic shadows', 'golden hour']  # fmt: off
+
+_CHAT_SYSTEM_PROMPTS = [
+    "You are a helpful assistant.",
+    "You are a concise assistant. Keep answers short.",
+    "You are a friendly tutor who explains things step by step.",
+]
+_CHAT_TOPICS = ['black holes', 'sourdough bread', 'the french revolution', 'binary search', 'photosynthesis', 'compound interest', 'the offside rule', 'jazz harmony', 'volcanoes', 'public key cryptography', 'marathon training', 'the roman empire']  # fmt: off
+_CHAT_QUESTIONS = [
+    "Can you explain {topic} to me like I'm new to it?",
+    "What are three common misconceptions about {topic}?",
+    "Write a short poem about {topic}.",
+    "Give me a quick summary of {topic}, then a fun fact.",
+    "How would you teach {topic} to a ten year old?",
+    "What's the history behind {topic}?",
+]
+_CHAT_FOLLOW_UPS = [
+    "Thanks! Can you go into a bit more detail?",
+    "Could you give me an example?",
+    "Can you make that shorter?",
+    "What should I read next to learn more?",
+]
+
+_CHAT_TASK_TO_MODEL: Dict[Task, str] = {
+    Task.chat_mixtral: utility_models.ChatModels.mixtral.value,
+    Task.chat_llama_3: utility_models.ChatModels.llama_3.value,
+    Task.chat_llama_3_1_8b: utility_models.ChatModels.llama_3_1_8b.value,
+    Task.chat_llama_3_1_70b: utility_models.ChatModels.llama_3_1_70b.value,
+}
+
+# engine, steps, cfg scale - all inside what ALLOWED_PARAMS_FOR_ENGINE lets through
+_IMAGE_TASK_TO_SETTINGS: Dict[Task, tuple] = {
+    Task.playground_text_to_image: (utility_models.EngineEnum.PLAYGROUND.value, 25, 4.0),
+    Task.playground_image_to_image: (utility_models.EngineEnum.PLAYGROUND.value, 25, 4.0),
+    Task.proteus_text_to_image: (utility_models.EngineEnum.PROTEUS.value, 8, 2.0),
+    Task.proteus_image_to_image: (utility_models.EngineEnum.PROTEUS.value, 8, 2.0),
+    Task.flux_schnell_text_to_image: (utility_models.EngineEnum.FLUX.value, 4, 1.0),
+    Task.flux_schnell_image_to_image: (utility_models.EngineEnum.FLUX.value, 4, 1.0),
+    Task.dreamshaper_text_to_image: (utility_models.EngineEnum.DREAMSHAPER.value, 8, 2.0),
+    Task.dreamshaper_image_to_image: (utility_models.EngineEnum.DREAMSHAPER.value, 8, 2.0),
+}
+
+_IMAGE_SIZES = [(1024, 1024), (768, 1344), (1344, 768), (1216, 832), (832, 1216)]
+
+
+@functools.lru_cache()
+def get_postie_b64() -> str:
+    """Encoded once, then shared by every locally made image to image & inpainting payload"""
+    with Image.open(POSTIE_PATH) as image:
+        return core_utils.pil_to_base64(image.convert("RGB"))
+
+
+@functools.lru_cache()
+def get_postie_variants() -> image_perturbation.PerturbedJpeg:
+    """Shared with the synthetic data manager, so the postie is only encoded once"""
+    with Image.open(POSTIE_PATH) as image:
+        return image_perturbation.PerturbedJpeg(image)
+
+
+@functools.lru_cache()
+def get_inpainting_mask_b64() -> str:
+    with Image.open(POSTIE_PATH) as image:
+        width, height = image.size
+    mask = Image.new("L", (width, height), 0)
+    ImageDraw.Draw(mask).rectangle((width // 4, height // 4, width * 3 // 4, height * 3 // 4), fill=255)
+    buffered = io.BytesIO()
+    mask.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode()
+
+
+def get_image_prompt(rng: random.Random) -> dc.TextPrompt:
+    text = (
+        f"{rng.choice(_SUBJECTS)} {rng.choice(_SETTINGS)}, {rng.choice(_STYLES)}, "
+        f"{', '.join(rng.sample(_DETAILS, 2))}"
+    )
+    return dc.TextPrompt(text=text[:76], weight=1.0)
+
+
+def _get_chat_messages(rng: random.Random) -> List[utility_models.Message]:
+    topic = rng.choice(_CHAT_TOPICS)
+    messages = [
+        utility_models.Message(role=utility_models.Role.system, content=rng.choice(_CHAT_SYSTEM_PROMPTS)),
+        utility_models.Message(role=utility_models.Role.user, content=rng.choice(_CHAT_QUESTIONS).format(topic=topic)),
+    ]
+    if rng.random() < 0.3:
+        messages.append(
+            utility_models.Message(role=utility_models.Role.assistant, content=f"Sure, here's an overview of {topic}.")
+        )
+        messages.append(utility_models.Message(role=utility_models.Role.user, content=rng.choice(_CHAT_FOLLOW_UPS)))
+    return messages
+
+
+def _get_seed(rng: random.Random, validator_uid: int) -> int:
+    return rng.randint(core_cst.SEED_CHUNK_SIZE * validator_uid, core_cst.SEED_CHUNK_SIZE * (validator_uid + 1) - 1)
+
+
+def _chat(task: Task, rng: random.Random, validator_uid: int) -> Dict[str, Any]:
+    return base_models.ChatIncoming(
+        messages=_get_chat_messages(rng),
+        temperature=round(rng.uniform(0, 1), 2),
+        max_tokens=rng.choice([200, 500, 1000]),
+        seed=_get_seed(rng, validator_uid),
+        model=_CHAT_TASK_TO_MODEL[task],
+    ).dict()
+
+
+def _text_to_image(task: Task, rng: random.Random, validator_uid: int) -> Dict[str, Any]:
+    engine, steps, cfg_scale = _IMAGE_TASK_TO_SETTINGS[task]
+    height, width = rng.choice(_IMAGE_SIZES)
+    return base_models.TextToImageIncoming(
+        text_prompts=[get_image_prompt(rng)],
+        seed=_get_seed(rng, validator_uid),
+        engine=engine,
+        steps=steps,
+        cfg_scale=cfg_scale,
+        height=height,
+        width=width,
+    ).dict()
+
+
+def _image_to_image(task: Task, rng: random.Random, validator_uid: int) -> Dict[str, Any]:
+    engine, steps, cfg_scale = _IMAGE_TASK_TO_SETTINGS[task]
+    return base_models.ImageToImageIncoming(
+        init_image=get_postie_b64(),
+        text_prompts=[get_image_prompt(rng)],
+        image_strength=round(rng.uniform(0.2, 0.7), 2),
+        seed=_get_seed(rng, validator_uid),
+        engine=engine,
+        steps=steps,
+        cfg_scale=cfg_scale,
+    ).dict()
+
+
+def _inpaint(task: Task, rng: random.Random, validator_uid: int) -> Dict[str, Any]:
+    return base_models.InpaintIncoming(
+        init_image=get_postie_b64(),
+        mask_image=get_inpainting_mask_b64(),
+        text_prompts=[get_image_prompt(rng)],
+        seed=_get_seed(rng, validator_uid),
+    ).dict()
+
+
+def _avatar(task: Task, rng: random.Random, validator_uid: int) -> Dict[str, Any]:
+    return base_models.AvatarIncoming(
+        seed=_get_seed(rng, validator_uid),
+        text_prompts=[get_image_prompt(rng)],
+        height=1280,
+        width=1280,
+        steps=15,
+        control_strength=0.5,
+        ipadapter_strength=0.5,
+        init_image=get_postie_variants().get_variant(),
+    ).dict()
+
+
+_TASK_TO_GENERATOR: Dict[Task, Callable[[Task, random.Random, int], Dict[str, Any]]] = {
+    **{task: _chat for task in _CHAT_TASK_TO_MODEL},
+    Task.playground_text_to_image: _text_to_image,
+    Task.proteus_text_to_image: _text_to_image,
+    Task.flux_schnell_text_to_image: _text_to_image,
+    Task.dreamshaper_text_to_image: _text_to_image,
+    Task.playground_image_to_image: _image_to_image,
+    Task.proteus_image_to_image: _image_to_image,
+    Task.flux_schnell_image_to_image: _image_to_image,
+    Task.dreamshaper_image_to_image: _image_to_image,
+    Task.jugger_inpainting: _inpaint,
+    Task.avatar: _avatar,
+}
+
+
+def can_generate(task: Task) -> bool:
+    return task in _TASK_TO_GENERATOR
+
+
+def generate_synthetic_data(task: Task, validator_uid: int, rng: random.Random = random) -> Dict[str, Any]:
+    """Raises KeyError for a task we can't make payloads for - check can_generate first"""
+    return _TASK_TO_GENERATOR[task](task, rng, validator_uid)
@@ -1,35 +1,24 @@
 import asyncio
-import pybase64 as base64
 import random
 import string
-import threading
 import time
+from collections import deque
 import httpx
-from typing import Dict, Any
+from typing import Deque, Dict, Any, List, Optional
 from config.validator_config import config as validator_config
 from core import Task, tasks, constants as core_cst
 import bittensor as bt
 from core import dataclasses as dc
 from models import base_models
-from validation.proxy import validation_utils
+from validation.proxy.utils import constants as cst
+from validation.synthetic_data import image_perturbation, local_generations
 from core import utils as core_utils
-from PIL.Image import Image
 
 SEED = "seed"
 TEMPERATURE = "temperature"
 TEXT_PROMPTS = "text_prompts"
 
 
-def load_postie_to_pil(image_path: str) -> Image:
-    with open(image_path, "rb") as image_file:
-        base64_string = base64.b64encode(image_file.read()).decode("utf-8")
-    pil_image = core_utils.base64_to_pil(base64_string)
-    return pil_image
-
-
-my_boy_postie = load_postie_to_pil("validation/synthetic_data/postie.png")
-
-
 def _get_random_letters(length: int) -> str:
     letters = string.ascii_letters
     return "".join(random.choice(letters) for i in range(length))
@@ -52,67 +41,107 @@ def _get_random_avatar_text_prompt() -> dc.TextPrompt:
     return dc.TextPrompt(text=text, weight=1.0)
 
 
-def _my_boy_postie() -> str:
-    b64_postie_altered = validation_utils.alter_image(my_boy_postie)
-    return b64_postie_altered
+def _with_suffix_on_first_prompt(text_prompts: List[Dict[str, Any]], suffix: str) -> List[Dict[str, Any]]:
+    """A new list with a new first prompt, so the pooled payload's own prompts are never touched"""
+    first_prompt = dict(text_prompts[0])
+    first_prompt["text"] = (first_prompt["text"] + suffix)[:76]
+    return [first_prompt, *text_prompts[1:]]
 
 
 class SyntheticDataManager:
-    def __init__(self, validator_uid: int) -> None:
-        self.task_to_stored_synthetic_data: Dict[Task, Dict[str, Any]] = {}
+    """
+    Keeps a small ring buffer of ready made payloads per task, topped up in the background from the orchestrator.
+    Pooled payloads are never modified: every caller gets its own copy, with a fresh seed & tweaks layered on top
+    """
 
-        thread = threading.Thread(target=self._start_async_loop, daemon=True)
-        thread.start()
+    def __init__(self, validator_uid: int) -> None:
         self.validator_uid = validator_uid
-
-    def _start_async_loop(self):
-        """Start the event loop and run the async tasks."""
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(self._continuously_fetch_synthetic_data_for_tasks())
+        self.task_to_payloads: Dict[Task, Deque[Dict[str, Any]]] = {
+            task: deque(maxlen=cst.SYNTHETIC_PAYLOAD_POOL_SIZE) for task in Task
+        }
+        self._task_to_payloads_ready: Dict[Task, asyncio.Event] = {task: asyncio.Event() for task in Task}
+        # Only the tasks we actually send synthetic queries for
+        self.synthetic_tasks: List[Task] = [task for task in Task if task in tasks.TASKS_TO_SYNAPSE]
+        self.postie_variants: Optional[image_perturbation.PerturbedJpeg] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._refill_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.postie_variants is None:
+            self.postie_variants = local_generations.get_postie_variants()
+        if cst.LOCAL_SYNTHETIC_DATA_ONLY:
+            bt.logging.info("Only using locally made synthetic data")
+            return
+        if self._refill_task is None:
+            self._client = httpx.AsyncClient(
+                timeout=7,
+                limits=httpx.Limits(max_connections=cst.SYNTHETIC_REFILL_BATCH_SIZE * 2),
+            )
+            self._refill_task = asyncio.create_task(self._continuously_fetch_synthetic_data_for_tasks())
+
+    def _get_tasks_needing_synthetic_data(self) -> List[Task]:
+        return [task for task in self.synthetic_tasks if not self.task_to_payloads[task]]
 
     async def _continuously_fetch_synthetic_data_for_tasks(self) -> None:
-        # Initial fetch be quick
-        tasks_needing_synthetic_data = [task for task in tasks.Task if task not in self.task_to_stored_synthetic_data]
-        while tasks_needing_synthetic_data:
-            sync_tasks = []
-            for task in tasks_needing_synthetic_data:
-                sync_tasks.append(asyncio.create_task(self._update_synthetic_data_for_task(task)))
-
-            await asyncio.gather(*sync_tasks)
-            tasks_needing_synthetic_data = [
-                task for task in tasks.Task if task not in self.task_to_stored_synthetic_data
-            ]
-            time.sleep(0.1)
+        # Initial fetch be quick - but a task the orchestrator never serves mustn't hold up refilling all the others
+        give_up_at = time.time() + cst.SYNTHETIC_INITIAL_FETCH_SECONDS
+        tasks_needing_synthetic_data = self._get_tasks_needing_synthetic_data()
+        while tasks_needing_synthetic_data and time.time() < give_up_at:
+            await asyncio.gather(*[self._refill_payloads_for_task(task) for task in tasks_needing_synthetic_data])
+            tasks_needing_synthetic_data = self._get_tasks_needing_synthetic_data()
+            if tasks_needing_synthetic_data:
+                await asyncio.sleep(1)
+        if tasks_needing_synthetic_data:
+            missing_tasks = ", ".join(task.value for task in tasks_needing_synthetic_data)
+            bt.logging.warning(f"Still no synthetic data for tasks {missing_tasks}, carrying on anyway")
 
         while True:
-            for task in tasks.Task:
-                await self._update_synthetic_data_for_task(task)
-                await asyncio.sleep(3)
-
-    async def fetch_synthetic_data_for_task(self, task: Task) -> Dict[str, Any]:
-        while task not in self.task_to_stored_synthetic_data:
-            bt.logging.warning(f"Synthetic data not found for task {task} yet, waiting...")
-            await asyncio.sleep(10)
+            for task in self.synthetic_tasks:
+                await self._refill_payloads_for_task(task)
+                await asyncio.sleep(cst.SYNTHETIC_REFILL_INTERVAL_SECONDS)
+
+    async def _refill_payloads_for_task(self, task: Task) -> None:
+        """Fetches a batch at once over the shared client, and adds whatever came back to the ring buffer"""
+        payloads = await asyncio.gather(
+            *[self._update_synthetic_data_for_task(task) for _ in range(cst.SYNTHETIC_REFILL_BATCH_SIZE)]
+        )
+        for payload in payloads:
+            if payload is not None:
+                self.task_to_payloads[task].append(payload)
+        if self.task_to_payloads[task]:
+            self._task_to_payloads_ready[task].set()
+
+    async def fetch_synthetic_data_for_task(self, task: Task) -> Optional[Dict[str, Any]]:
+        """None if there's nothing to make a payload from for this task, even after waiting a little while"""
+        if self.task_to_payloads[task]:
+            # Shallow copy: anything changed below is replaced on the copy, rather than changed in place
+            synth_data = dict(random.choice(self.task_to_payloads[task]))
+        elif local_generations.can_generate(task):
+            # Nothing from the orchestrator (yet), so make one here rather than hold up synthetic querying
+            synth_data = local_generations.generate_synthetic_data(task, self.validator_uid)
+        else:
+            try:
+                await asyncio.wait_for(
+                    self._task_to_payloads_ready[task].wait(), timeout=cst.SYNTHETIC_DATA_WAIT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                bt.logging.warning(f"No synthetic data for task {task.value} yet, skipping")
+                return None
+            synth_data = dict(random.choice(self.task_to_payloads[task]))
 
-        synth_data = self.task_to_stored_synthetic_data[task]
         task_config = tasks.get_task_config(task)
-        seed = core_utils.get_seed(core_cst.SEED_CHUNK_SIZE, self.validator_uid)
-        synth_data[SEED] = seed
+        synth_data[SEED] = core_utils.get_seed(core_cst.SEED_CHUNK_SIZE, self.validator_uid)
         if task_config.task_type == tasks.TaskType.IMAGE:
-            text_prompts = synth_data[TEXT_PROMPTS]
-            text = text_prompts[0]["text"]
-            new_text = text + _get_random_letters(4)
-            new_text = new_text[:76]
-            synth_data[TEXT_PROMPTS][0]["text"] = new_text
+            synth_data[TEXT_PROMPTS] = _with_suffix_on_first_prompt(synth_data[TEXT_PROMPTS], _get_random_letters(4))
         elif task_config.task_type == tasks.TaskType.TEXT:
             synth_data[TEMPERATURE] = round(random.uniform(0, 1), 2)
 
         return synth_data
 
-    async def _update_synthetic_data_for_task(self, task: Task) -> Dict[str, Any]:
+    async def _update_synthetic_data_for_task(self, task: Task) -> Optional[Dict[str, Any]]:
         if task == Task.avatar:
-            synthetic_data = base_models.AvatarIncoming(
+            init_image = self.postie_variants.get_variant()
+            return base_models.AvatarIncoming(
                 seed=core_utils.get_seed(core_cst.SEED_CHUNK_SIZE, self.validator_uid),
                 text_prompts=[_get_random_avatar_text_prompt()],
                 height=1280,
@@ -120,30 +149,26 @@ class SyntheticDataManager:
                 steps=15,
                 control_strength=0.5,
                 ipadapter_strength=0.5,
-                init_image=_my_boy_postie(),
+                init_image=init_image,
             ).dict()
-            self.task_to_stored_synthetic_data[task] = synthetic_data
-        else:
-            try:
-                async with httpx.AsyncClient(timeout=7) as client:
-                    json_data = {"task": task.value}
-                    response = await client.post(
-                        validator_config.external_server_url + "get-synthetic-data",
-                        json=json_data,
-                    )
-                    response.raise_for_status()  # raises an HTTPError if an unsuccessful status code was received
-            except httpx.RequestError:
-                return None
-            except httpx.HTTPStatusError:
-                # bt.logging.warning(
-                #     f"Syntehtic data error; status code {err.response.status_code} while requesting {err.request.url!r}: {err}"
-                # )
-                return None
-
-            try:
-                response_json = response.json()
-            except ValueError as e:
-                bt.logging.error(f"Synthetic data Response contained invalid JSON: error :{e}")
-                return None
 
-            self.task_to_stored_synthetic_data[task] = response_json
+        try:
+            json_data = {"task": task.value}
+            response = await self._client.post(
+                validator_config.external_server_url + "get-synthetic-data",
+                json=json_data,
+            )
+            response.raise_for_status()  # raises an HTTPError if an unsuccessful status code was received
+        except httpx.RequestError:
+            return None
+        except httpx.HTTPStatusError:
+            # bt.logging.warning(
+            #     f"Syntehtic data error; status code {err.response.status_code} while requesting {err.request.url!r}: {err}"
+            # )
+            return None
+
+        try:
+            return response.json()
+        except ValueError as e:
+            bt.logging.error(f"Synthetic data Response contained invalid JSON: error :{e}")
+            return None
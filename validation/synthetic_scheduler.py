@@ -0,0 +1,176 @@
+"""
+One scheduler for all of a period's synthetic queries.
+
+Rather than a sleeping coroutine per (task, uid), holding on to every request it makes until the period is over,
+there's a min heap of when each (task, uid) is next due. The scheduler sleeps until the earliest one, fires it off
+into a bounded pool of in flight requests (within the global synthetic budget), and lets go of each request
+as soon as it's done.
+So memory & wakeups scale with what's actually in flight, not with how many requests the period makes.
+"""
+
+import asyncio
+import heapq
+import random
+import time
+from itertools import count
+from typing import AsyncGenerator, Dict, List, Set, Tuple
+
+import bittensor as bt
+
+from core import Task, tasks, constants as core_cst
+from models import base_models
+from validation.models import UIDRecord
+from validation.proxy.utils import query_utils, constants as cst
+from validation.proxy.utils.circuit_breaker import circuit_breakers
+from validation.scoring import scoring_utils
+from validation.synthetic_budget import SyntheticBudget, estimate_payload_bytes
+from validation.synthetic_data import synthetic_generations
+
+
+class _ScheduledUid:
+    __slots__ = ("uid_record", "volume_to_score", "requests_fired")
+
+    def __init__(self, uid_record: UIDRecord, volume_to_score: float) -> None:
+        self.uid_record = uid_record
+        self.volume_to_score = volume_to_score
+        self.requests_fired = 0
+
+
+class SyntheticScheduler:
+    def __init__(
+        self,
+        task_to_uid_queue: Dict[Task, query_utils.UIDQueue],
+        dendrite: bt.dendrite,
+        synthetic_data_manager: synthetic_generations.SyntheticDataManager,
+        synthetic_budget: SyntheticBudget,
+        ends_at: float,
+        is_testnet: bool,
+        max_in_flight: int = cst.MAX_IN_FLIGHT_SYNTHETIC_REQUESTS,
+    ) -> None:
+        self.task_to_uid_queue = task_to_uid_queue
+        self.dendrite = dendrite
+        self.synthetic_data_manager = synthetic_data_manager
+        self.synthetic_budget = synthetic_budget
+        self.ends_at = ends_at
+        self.is_testnet = is_testnet
+
+        # (next fire time, tie breaker, uid) - the tie breaker stops heapq ever comparing two uids
+        self._heap: List[Tuple[float, int, _ScheduledUid]] = []
+        self._sequence = count()
+        self._in_flight: Set[asyncio.Task] = set()
+        self._in_flight_slots = asyncio.Semaphore(max_in_flight)
+        self._requests_scheduled = 0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, uid_record: UIDRecord, volume_to_score: float) -> None:
+        """Spreads the uid's remaining synthetic requests evenly until the end of the period"""
+        if uid_record.synthetic_requests_still_to_make <= 0 or self.ends_at <= time.time():
+            return
+        self._requests_scheduled += uid_record.synthetic_requests_still_to_make
+        # Random first fire to make sure we dont burst
+        first_fire_at = time.time() + self._get_delay_between_requests(uid_record) * random.random()
+        heapq.heappush(self._heap, (first_fire_at, next(self._sequence), _ScheduledUid(uid_record, volume_to_score)))
+
+    def _get_delay_between_requests(self, uid_record: UIDRecord) -> float:
+        """
+        Worked out afresh every time from what's left, so a uid that got held up by the budget speeds up
+        to still make all its requests by the end of the period
+        """
+        return max(self.ends_at - time.time(), 0) / max(uid_record.synthetic_requests_still_to_make, 1)
+
+    async def run(self) -> None:
+        time_left = self.ends_at - time.time()
+        if time_left > 0:
+            self.synthetic_budget.set_required_request_rate(self._requests_scheduled / time_left)
+        try:
+            while self._heap:
+                fire_at = self._heap[0][0]
+                wait = fire_at - time.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                _, _, scheduled_uid = heapq.heappop(self._heap)
+                await self._fire(scheduled_uid)
+                if scheduled_uid.uid_record.synthetic_requests_still_to_make > 0:
+                    delay_between_requests = self._get_delay_between_requests(scheduled_uid.uid_record)
+                    next_fire_at = time.time() + delay_between_requests * (random.random() * 0.05 + 0.95)
+                    heapq.heappush(self._heap, (next_fire_at, next(self._sequence), scheduled_uid))
+                else:
+                    uid_record = scheduled_uid.uid_record
+                    bt.logging.info(
+                        f"Done synthetic querying for task: {uid_record.task} and uid: {uid_record.axon_uid} "
+                        f"and volume: {uid_record.declared_volume}"
+                    )
+
+            if self._in_flight:
+                await asyncio.gather(*self._in_flight, return_exceptions=True)
+        except asyncio.CancelledError:
+            for request in self._in_flight:
+                request.cancel()
+            raise
+
+    async def _fire(self, scheduled_uid: _ScheduledUid) -> None:
+        uid_record = scheduled_uid.uid_record
+        task, uid = uid_record.task, uid_record.axon_uid
+
+        if scheduled_uid.requests_fired % 100 == 0 and (scheduled_uid.requests_fired > 0 or self.is_testnet):
+            bt.logging.debug(
+                f"synthetic requests still to make: {uid_record.synthetic_requests_still_to_make} on iteration "
+                f"{scheduled_uid.requests_fired} for uid {uid} and task {task}"
+            )
+        scheduled_uid.requests_fired += 1
+
+        if uid_record.consumed_volume >= scheduled_uid.volume_to_score:
+            uid_record.synthetic_requests_still_to_make = 0
+            return
+
+        # Need to lower this here so its lowered regardless of the result of the request
+        uid_record.synthetic_requests_still_to_make -= 1
+
+        if not circuit_breakers.allow_request(task, uid):
+            scoring_utils.record_short_circuited_request(uid_record)
+            return
+
+        await self.synthetic_budget.acquire_request()
+        # A full pool holds up the whole schedule, rather than piling up ever more requests on slow miners
+        await self._in_flight_slots.acquire()
+        self.task_to_uid_queue[task].move_to_end(uid)
+        request = asyncio.create_task(self._make_request(uid_record))
+        self._in_flight.add(request)
+        request.add_done_callback(self._on_request_done)
+
+    def _on_request_done(self, request: asyncio.Task) -> None:
+        self._in_flight.discard(request)
+        self._in_flight_slots.release()
+        if not request.cancelled() and request.exception() is not None:
+            bt.logging.error(f"Error making a synthetic request: {request.exception()}")
+
+    async def _make_request(self, uid_record: UIDRecord) -> None:
+        task = uid_record.task
+        # Bounded wait, so tasks with nothing to send can't sit on every in flight slot
+        synthetic_data = await self.synthetic_data_manager.fetch_synthetic_data_for_task(task)
+        if synthetic_data is None:
+            return
+        await self.synthetic_budget.acquire_bytes(estimate_payload_bytes(synthetic_data))
+
+        synthetic_synapse = tasks.TASKS_TO_SYNAPSE[task](**synthetic_data)
+        stream = isinstance(synthetic_synapse, bt.StreamingSynapse)
+        outgoing_model = getattr(base_models, synthetic_synapse.__class__.__name__ + core_cst.OUTGOING)
+
+        if not stream:
+            await query_utils.query_miner_no_stream(
+                uid_record, synthetic_synapse, outgoing_model, task, self.dendrite, synthetic_query=True
+            )
+        else:
+            generator = query_utils.query_miner_stream(
+                uid_record, synthetic_synapse, outgoing_model, task, self.dendrite, synthetic_query=True
+            )
+            # We need to iterate through the generator to consume it - so the request finishes
+            await self._consume_generator(generator)
+
+    @staticmethod
+    async def _consume_generator(generator: AsyncGenerator) -> None:
+        async for _ in generator:
+            pass
@@ -1,46 +1,25 @@
 import asyncio
 import collections
 import random
-from typing import AsyncGenerator, Dict, List, Union
+import time
+from typing import AsyncGenerator, Dict, List, Optional, Set, Tuple, Union
 
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from core import Task, bittensor_overrides as bto
+from core import Task
 import bittensor as bt
 from validation.models import UIDRecord, axon_uid
+from validation import period_checkpoint
+from validation.synthetic_budget import SyntheticBudget
+from validation.synthetic_scheduler import SyntheticScheduler
 from validation.synthetic_data import synthetic_generations
-from core import tasks, constants as core_cst
-from validation.proxy.utils import query_utils
-from models import base_models, utility_models
+from core import constants as core_cst
+from validation.proxy.utils import query_utils, constants as cst
+from validation.proxy.utils.miner_selection import miner_selector
+from validation.proxy.utils.circuit_breaker import BreakerState, circuit_breakers
+from models import utility_models
 from validation.db.db_management import db_manager
 
-# LLM VOLUMES ARE IN TOKENS,
-# IMAGE VOLUMES ARE IN STEP
-# CLIP IS IN IMAGES
-TASK_TO_VOLUME_TO_REQUESTS_CONVERSION: Dict[Task, float] = {
-    Task.chat_llama_3: 300,
-    Task.chat_mixtral: 300,
-    Task.playground_text_to_image: 50,
-    Task.playground_image_to_image: 50,
-    #
-    Task.chat_llama_3_1_8b: 300,
-    Task.chat_llama_3_1_70b: 300,
-    #
-    Task.proteus_text_to_image: 10,
-    Task.flux_schnell_text_to_image: 25,
-    Task.dreamshaper_text_to_image: 10,
-    #
-    Task.proteus_image_to_image: 10,
-    Task.flux_schnell_image_to_image: 25,
-    Task.dreamshaper_image_to_image: 10,
-    #
-    # Task.upscale: 1,
-    #
-    Task.jugger_inpainting: 20,
-    Task.avatar: 10,
-    Task.clip_image_embeddings: 1,
-}
-
 
 async def _async_chain(first_chunk, async_gen):
     yield first_chunk
@@ -48,192 +27,274 @@ async def _async_chain(first_chunk, async_gen):
         yield item
 
 
+class ScoringPeriod:
+    """
+    The queues & records for one scoring period. It's built in full before it's swapped in for organic queries,
+    so organic routing never sees a half set up period, and the finished one can be wrapped up on the side
+    """
+
+    def __init__(self, capacities_for_tasks: Dict[Task, Dict[axon_uid, float]]) -> None:
+        self.capacities_for_tasks = capacities_for_tasks
+        self.uid_records_for_tasks: Dict[Task, Dict[axon_uid, UIDRecord]] = collections.defaultdict(dict)
+        self.task_to_uid_queue: Dict[Task, query_utils.UIDQueue] = {task: query_utils.UIDQueue() for task in Task}
+        self.volumes_to_score: Dict[Tuple[Task, axon_uid], float] = {}
+        self.synthetic_scoring_task: Optional[asyncio.Task] = None
+        self.started_at: Optional[float] = None
+
+    def calculate_period_scores_for_uids(self) -> None:
+        for task in self.uid_records_for_tasks:
+            for record in self.uid_records_for_tasks[task].values():
+                record.calculate_period_score()
+
+
 class UidManager:
     def __init__(
         self,
-        capacities_for_tasks: Dict[Task, Dict[axon_uid, float]],
         dendrite: bt.dendrite,
         validator_hotkey: str,
-        uid_to_uid_info: Dict[axon_uid, utility_models.UIDinfo],
         synthetic_data_manager: synthetic_generations.SyntheticDataManager,
+        synthetic_budget: SyntheticBudget,
         is_testnet: bool,
     ) -> None:
-        self.capacities_for_tasks = capacities_for_tasks
         self.dendrite = dendrite
         self.validator_hotkey = validator_hotkey
-        self.uid_to_axon: Dict[axon_uid, bto.axon] = {info.uid: info.axon for info in uid_to_uid_info.values()}
-
-        self.uid_records_for_tasks: Dict[Task, Dict[axon_uid, UIDRecord]] = collections.defaultdict(dict)
-        self.synthetic_scoring_tasks: List[asyncio.Task] = []
-        self.task_to_uid_queue: Dict[Task, query_utils.UIDQueue] = {}
         self.synthetic_data_manager = synthetic_data_manager
-
+        self.synthetic_budget = synthetic_budget
         self.is_testnet = is_testnet
 
-    def calculate_period_scores_for_uids(self) -> None:
-        for task in self.uid_records_for_tasks:
-            for record in self.uid_records_for_tasks[task].values():
-                record.calculate_period_score()
+        # The period organic queries are routed to. Only ever replaced in one go, by start_period
+        self.current_period: Optional[ScoringPeriod] = None
+        circuit_breakers.add_listener(self._on_circuit_breaker_change)
 
-    async def store_period_scores(self) -> None:
-        for uid_records in self.uid_records_for_tasks.values():
+    async def store_period_scores(self, period: ScoringPeriod) -> None:
+        for uid_records in period.uid_records_for_tasks.values():
             for uid_record in uid_records.values():
                 await db_manager.insert_uid_record(uid_record, self.validator_hotkey)
 
-    async def start_synthetic_scoring(self) -> None:
-        self.synthetic_scoring_tasks = []
+    def apply_uid_info_changes(
+        self, uid_to_uid_info: Dict[axon_uid, utility_models.UIDinfo], changed_uids: Set[axon_uid]
+    ) -> None:
+        """
+        The metagraph changed mid period. Moved axons get queried at their new address from now on,
+        and uids that left or changed hands stop getting queried, since their records are for the old hotkey
+        """
+        if self.current_period is None:
+            return
+        for uid in changed_uids:
+            uid_info = uid_to_uid_info.get(uid)
+            for task, uid_records in self.current_period.uid_records_for_tasks.items():
+                uid_record = uid_records.get(uid)
+                if uid_record is None:
+                    continue
+                if uid_info is None or uid_info.hotkey != uid_record.hotkey:
+                    self.current_period.task_to_uid_queue[task].remove_uid(uid)
+                else:
+                    uid_record.axon = uid_info.axon
+
+    def _on_circuit_breaker_change(self, task: Task, uid: axon_uid, state: BreakerState) -> None:
+        if self.current_period is None:
+            return
+        uid_queue = self.current_period.task_to_uid_queue[task]
+        if state == BreakerState.OPEN:
+            uid_queue.remove_uid(uid)
+        elif state == BreakerState.CLOSED and uid in self.current_period.uid_records_for_tasks[task]:
+            uid_queue.add_uid(uid)
+
+    def stage_period(
+        self,
+        capacities_for_tasks: Dict[Task, Dict[axon_uid, float]],
+        uid_to_uid_info: Dict[axon_uid, utility_models.UIDinfo],
+    ) -> ScoringPeriod:
+        """Sets up the records & queues for the next period, without touching the one being served"""
+        period = ScoringPeriod(capacities_for_tasks)
         for task in Task:
-            self.task_to_uid_queue[task] = query_utils.UIDQueue()
-            for uid, volume in self.capacities_for_tasks.get(task, {}).items():
-                # Need to add before start synthetic scoring so we can query the uid
+            for uid, volume in capacities_for_tasks.get(task, {}).items():
                 volume_to_score = volume * self._get_percentage_of_tasks_to_score()
                 if volume_to_score == 0:
                     continue
-                self.task_to_uid_queue[task].add_uid(uid)
-                self.synthetic_scoring_tasks.append(
-                    asyncio.create_task(
-                        self.handle_task_scoring_for_uid(
-                            task,
-                            uid,
-                            volume,
-                            axon=self.uid_to_axon[uid],
-                        )
+                if task not in cst.TASK_TO_VOLUME_TO_REQUESTS_CONVERSION:
+                    bt.logging.warning(
+                        f"Task {task} not in TASK_TO_VOLUME_CONVERSION, it will not be scored. This should not happen."
                     )
+                    continue
+                uid_info = uid_to_uid_info.get(uid)
+                if uid_info is None:
+                    continue
+                number_of_requests = max(int(volume_to_score / cst.TASK_TO_VOLUME_TO_REQUESTS_CONVERSION[task]), 1)
+                period.uid_records_for_tasks[task][uid] = UIDRecord(
+                    axon_uid=uid,
+                    task=task,
+                    synthetic_requests_still_to_make=number_of_requests,
+                    declared_volume=volume,
+                    axon=uid_info.axon,
+                    hotkey=uid_info.axon.hotkey,
+                )
+                period.volumes_to_score[(task, uid)] = volume_to_score
+                if not circuit_breakers.is_open(task, uid):
+                    period.task_to_uid_queue[task].add_uid(uid)
+        return period
+
+    def resume_period(
+        self,
+        checkpoint: period_checkpoint.PeriodCheckpoint,
+        uid_to_uid_info: Dict[axon_uid, utility_models.UIDinfo],
+    ) -> ScoringPeriod:
+        """
+        Rebuilds the period from before a restart, counters and all, so it carries on where it left off.
+        Records for uids that have since changed hands are dropped
+        """
+        period = ScoringPeriod(checkpoint.get_capacities_for_tasks())
+        period.started_at = checkpoint.started_at
+        for record in checkpoint.records:
+            uid_info = uid_to_uid_info.get(record.uid)
+            if uid_info is None or uid_info.hotkey != record.hotkey:
+                continue
+            period.uid_records_for_tasks[record.task][record.uid] = UIDRecord(
+                axon_uid=record.uid,
+                task=record.task,
+                synthetic_requests_still_to_make=record.synthetic_requests_still_to_make,
+                declared_volume=record.declared_volume,
+                consumed_volume=record.consumed_volume,
+                total_requests_made=record.total_requests_made,
+                requests_429=record.requests_429,
+                requests_500=record.requests_500,
+                axon=uid_info.axon,
+                hotkey=record.hotkey,
+            )
+            period.volumes_to_score[(record.task, record.uid)] = record.volume_to_score
+        for task in Task:
+            for uid in checkpoint.get_queued_uids(task):
+                if uid in period.uid_records_for_tasks[task]:
+                    period.task_to_uid_queue[task].add_uid(uid)
+        return period
+
+    def checkpoint_current_period(self, netuid: int) -> Optional[period_checkpoint.PeriodCheckpoint]:
+        period = self.current_period
+        if period is None:
+            return None
+        return period_checkpoint.PeriodCheckpoint(
+            netuid=netuid,
+            validator_hotkey=self.validator_hotkey,
+            started_at=period.started_at,
+            created_at=time.time(),
+            capacities={task.value: capacities for task, capacities in period.capacities_for_tasks.items()},
+            queued_uids={task.value: list(queue.uid_map) for task, queue in period.task_to_uid_queue.items()},
+            records=[
+                period_checkpoint.UIDRecordCheckpoint(
+                    task=task,
+                    uid=uid,
+                    hotkey=record.hotkey,
+                    declared_volume=record.declared_volume,
+                    volume_to_score=period.volumes_to_score[(task, uid)],
+                    synthetic_requests_still_to_make=record.synthetic_requests_still_to_make,
+                    consumed_volume=record.consumed_volume,
+                    total_requests_made=record.total_requests_made,
+                    requests_429=record.requests_429,
+                    requests_500=record.requests_500,
                 )
-        bt.logging.info(f"Starting querying for {len(self.synthetic_scoring_tasks)} tasks 🔥")
+                for task, uid_records in period.uid_records_for_tasks.items()
+                for uid, record in uid_records.items()
+            ],
+        )
+
+    def start_period(self, period: ScoringPeriod) -> Optional[ScoringPeriod]:
+        """
+        Swaps the staged period in for organic queries & starts its synthetic scoring.
+        Returns the period it replaced, which keeps going until it's collected
+        """
+        if period.started_at is None:
+            period.started_at = time.time()
+        scheduler = SyntheticScheduler(
+            period.task_to_uid_queue,
+            self.dendrite,
+            self.synthetic_data_manager,
+            self.synthetic_budget,
+            ends_at=period.started_at + core_cst.SCORING_PERIOD_TIME * 0.98,
+            is_testnet=self.is_testnet,
+        )
+        for task, uid_records in period.uid_records_for_tasks.items():
+            for uid, uid_record in uid_records.items():
+                scheduler.schedule(uid_record, period.volumes_to_score[(task, uid)])
+        period.synthetic_scoring_task = asyncio.create_task(scheduler.run())
+        previous_period, self.current_period = self.current_period, period
+        bt.logging.info(f"Starting querying for {len(scheduler)} tasks 🔥")
+        return previous_period
 
-    async def collect_synthetic_scoring_results(self) -> None:
+    @staticmethod
+    async def collect_synthetic_scoring_results(period: ScoringPeriod) -> None:
+        timeout = max(period.started_at + cst.SYNTHETIC_SCORING_TIMEOUT_SECONDS - time.time(), 0)
         try:
-            await asyncio.wait_for(
-                asyncio.gather(*self.synthetic_scoring_tasks), timeout=60 * 70
-            )  # 1 hour and 10 minutes (70 mins)
+            # Shielded, so timing out leaves it to us to cancel the scheduler, below
+            await asyncio.wait_for(asyncio.shield(period.synthetic_scoring_task), timeout=timeout)
         except asyncio.TimeoutError:
-            bt.logging.error("Synthetic scoring tasks timed out after 10 minutes")
+            bt.logging.error(
+                f"Synthetic scoring tasks timed out after {cst.SYNTHETIC_SCORING_TIMEOUT_SECONDS // 60} minutes"
+            )
         except Exception as e:
             bt.logging.error(f"Error during synthetic scoring: {str(e)}")
         finally:
-            # Cancel any remaining tasks
-            for task in self.synthetic_scoring_tasks:
-                if not task.done():
-                    task.cancel()
-
-    async def handle_task_scoring_for_uid(
-        self, task: Task, uid: axon_uid, volume: float, axon: bt.chain_data.AxonInfo
-    ) -> None:
-        volume_to_score = volume * self._get_percentage_of_tasks_to_score()
-
-        uid_queue = self.task_to_uid_queue[task]
-
-        if task not in TASK_TO_VOLUME_TO_REQUESTS_CONVERSION:
-            bt.logging.warning(
-                f"Task {task} not in TASK_TO_VOLUME_CONVERSION, it will not be scored. This should not happen."
-            )
-            return
-        volume_to_requests_conversion = TASK_TO_VOLUME_TO_REQUESTS_CONVERSION[task]
-        number_of_requests = max(int(volume_to_score / volume_to_requests_conversion), 1)
-
-        uid_record = UIDRecord(
-            axon_uid=uid,
-            task=task,
-            synthetic_requests_still_to_make=number_of_requests,
-            declared_volume=volume,
-            axon=axon,
-            hotkey=axon.hotkey,
-        )
-        self.uid_records_for_tasks[task][uid] = uid_record
-
-        delay_between_requests = (core_cst.SCORING_PERIOD_TIME * 0.98) // (number_of_requests)
-
-        i = 0
-        tasks_in_progress = []
-
-        while uid_record.synthetic_requests_still_to_make > 0:
-            # Random perturbation to make sure we dont burst
-            if i == 0:
-                await asyncio.sleep(delay_between_requests * random.random())
-            else:
-                await asyncio.sleep(delay_between_requests * (random.random() * 0.05 + 0.95))
+            # Cancel any remaining requests
+            if not period.synthetic_scoring_task.done():
+                period.synthetic_scoring_task.cancel()
 
-            if i % 100 == 0 and (i > 0 or self.is_testnet):
-                bt.logging.debug(
-                    f"synthetic requests still to make: {uid_record.synthetic_requests_still_to_make} on iteration {i} for uid {uid_record.axon_uid} and task {task}"
-                )
-            if uid_record.consumed_volume >= volume_to_score:
+    async def make_organic_query(
+        self, task: Task, stream: bool, synapse: bt.Synapse, outgoing_model: BaseModel, hedge: bool = False
+    ) -> Union[utility_models.QueryResult, AsyncGenerator]:  # noqa: F821
+        # Held for the whole query, so a period swap mid failover can't mix up queues & records
+        period = self.current_period
+        if period is None:
+            return JSONResponse(content={"message": "Server booting, one sec"}, status_code=500)
+        queue = period.task_to_uid_queue[task]
+        uid_records = period.uid_records_for_tasks[task]
+        operation_timeout = cst.OPERATION_TIMEOUTS.get(synapse.__class__.__name__, 15)
+        deadline = time.time() + operation_timeout + cst.ORGANIC_FAILOVER_BUDGET_SECONDS
+        failed_uids: List[axon_uid] = []
+        # Already scored by _record_stalled_stream, so kept apart from failed_uids to not be penalised twice
+        stalled_uids: List[axon_uid] = []
+        query_result = None
+
+        for _ in range(cst.MAX_ORGANIC_ATTEMPTS):
+            time_left = deadline - time.time()
+            if time_left < cst.MIN_ORGANIC_ATTEMPT_SECONDS:
                 break
 
-            synthetic_data = await self.synthetic_data_manager.fetch_synthetic_data_for_task(task)
-
-            synthetic_synapse = tasks.TASKS_TO_SYNAPSE[task](**synthetic_data)
-            stream = isinstance(synthetic_synapse, bt.StreamingSynapse)
-            outgoing_model = getattr(base_models, synthetic_synapse.__class__.__name__ + core_cst.OUTGOING)
+            uid = self._get_uid_for_organic_query(task, queue, excluded_uids={*failed_uids, *stalled_uids})
+            if uid is None:
+                if not failed_uids and not stalled_uids:
+                    return JSONResponse(content={"error": f"No UIDs available for this task {task}"}, status_code=500)
+                break
+            uid_record = uid_records[uid]
 
             if not stream:
-                uid_queue.move_to_end(uid)
-                tasks_in_progress.append(
-                    asyncio.create_task(
-                        query_utils.query_miner_no_stream(
-                            uid_record, synthetic_synapse, outgoing_model, task, self.dendrite, synthetic_query=True
-                        )
-                    )
+                query_result = await self._query_miner_no_stream(
+                    task,
+                    queue,
+                    uid_records,
+                    uid_record,
+                    synapse,
+                    outgoing_model,
+                    hedge=hedge,
+                    response_timeout=min(operation_timeout, time_left),
                 )
+                if query_result is not None and query_result.success:
+                    break
+                query_result = None
+                failed_uids.append(uid)
             else:
-                uid_queue.move_to_end(uid)
                 generator = query_utils.query_miner_stream(
-                    uid_record, synthetic_synapse, outgoing_model, task, self.dendrite, synthetic_query=True
-                )
-                # We need to iterate through the generator to consume it - so the request finishes
-                tasks_in_progress.append(asyncio.create_task(self._consume_generator(generator)))
-
-            # Need to make this here so its lowered regardless of the result of the above
-            uid_record.synthetic_requests_still_to_make -= 1
-
-            i += 1
-
-        # NOTE: Do we want to do this semi regularly, to not exceed bandwidth perhaps?
-        await asyncio.gather(*tasks_in_progress)
-        bt.logging.info(f"Done synthetic querying for task: {task} and uid: {uid} and volume: {volume}")
-
-    async def make_organic_query(
-        self, task: Task, stream: bool, synapse: bt.Synapse, outgoing_model: BaseModel
-    ) -> Union[utility_models.QueryResult, AsyncGenerator]:  # noqa: F821
-        if task not in self.task_to_uid_queue:
-            task_q_to_log = {k.value: len(v.uid_map) for k, v in self.task_to_uid_queue.items()}
-            return JSONResponse(
-                content={
-                    "error": f"Task {task} not in task_to_uid_queue {task_q_to_log}. This should not happen. Type task: {type(task)}. It should be an enum"
-                },
-                status_code=500,
-            )
-        queue = self.task_to_uid_queue[task]
-        latest_uid = queue.get_uid_and_move_to_back()
-        if latest_uid is None:
-            return JSONResponse(content={"error": f"No UIDs available for this task {task}"}, status_code=500)
-        uid_record = self.uid_records_for_tasks[task][latest_uid]
-        attempts = 0
-        failed_uids = []
-
-        if not stream:
-            while attempts < 3:
-                query_result: utility_models.QueryResult = await query_utils.query_miner_no_stream(
                     uid_record,
                     synapse,
                     outgoing_model,
                     task,
-                    dendrite=self.dendrite,
+                    self.dendrite,
                     synthetic_query=False,
+                    connect_timeout=cst.ORGANIC_STREAM_CONNECT_TIMEOUT,
                 )
-                if query_result is None or not query_result.success:
-                    attempts += 1
-                    failed_uids.append(uid_record.axon_uid)
-                else:
-                    break
-        else:
-            while attempts < 3:
-                generator = query_utils.query_miner_stream(
-                    uid_record, synapse, outgoing_model, task, self.dendrite, synthetic_query=False
+                first_token_timeout = min(
+                    cst.TASK_TO_FIRST_TOKEN_TIMEOUT.get(task, cst.DEFAULT_FIRST_TOKEN_TIMEOUT), time_left
                 )
                 try:
-                    first_chunk = await generator.__anext__()
+                    first_chunk = await asyncio.wait_for(generator.__anext__(), timeout=first_token_timeout)
                     if first_chunk is None:
                         bt.logging.info("First chunk is none")
                         return JSONResponse(
@@ -242,14 +303,18 @@ class UidManager:
                     query_result = _async_chain(first_chunk, generator)
                     break
                 except StopAsyncIteration:
-                    failed_uids.append(uid_record.axon_uid)
-                    attempts += 1
-
-        if attempts >= 3:
+                    failed_uids.append(uid)
+                except asyncio.TimeoutError:
+                    bt.logging.info(f"Uid {uid} sent nothing within {first_token_timeout:.2f}s for {task}, failing over")
+                    await generator.aclose()
+                    self._record_stalled_stream(task, uid_record, synapse, first_token_timeout)
+                    stalled_uids.append(uid)
+
+        if query_result is None:
             return JSONResponse(content={"error": "Could not process request, mi apologies"}, status_code=500)
         else:
             for failed_uid in failed_uids:
-                uid_record = self.uid_records_for_tasks[task][failed_uid]
+                uid_record = uid_records[failed_uid]
                 query_utils.create_scoring_adjustment_task(utility_models.QueryResult(
                     status_code=500,
                     success=False,
@@ -263,6 +328,157 @@ class UidManager:
                 )
         return query_result
 
+    @staticmethod
+    def _record_stalled_stream(task: Task, uid_record: UIDRecord, synapse: bt.Synapse, timeout: float) -> None:
+        """The stream got cancelled before it could score itself, so score it here"""
+        query_utils.create_scoring_adjustment_task(
+            utility_models.QueryResult(
+                formatted_response=None,
+                axon_uid=uid_record.axon_uid,
+                miner_hotkey=uid_record.hotkey,
+                response_time=None,
+                error_message=f"No first token after {timeout:.2f} seconds",
+                task=task,
+                status_code=408,
+                success=False,
+            ),
+            synapse,
+            uid_record,
+            False,
+        )
+
+    async def _query_miner_no_stream(
+        self,
+        task: Task,
+        queue: query_utils.UIDQueue,
+        uid_records: Dict[axon_uid, UIDRecord],
+        uid_record: UIDRecord,
+        synapse: bt.Synapse,
+        outgoing_model: BaseModel,
+        hedge: bool,
+        response_timeout: float,
+    ) -> Optional[utility_models.QueryResult]:
+        if hedge and cst.ORGANIC_HEDGING_ENABLED:
+            return await self._query_miner_no_stream_hedged(
+                task, queue, uid_records, uid_record, synapse, outgoing_model, response_timeout=response_timeout
+            )
+        return await query_utils.query_miner_no_stream(
+            uid_record,
+            synapse,
+            outgoing_model,
+            task,
+            dendrite=self.dendrite,
+            synthetic_query=False,
+            connect_timeout=cst.ORGANIC_CONNECT_TIMEOUT,
+            response_timeout=response_timeout,
+        )
+
+    async def _query_miner_no_stream_hedged(
+        self,
+        task: Task,
+        queue: query_utils.UIDQueue,
+        uid_records: Dict[axon_uid, UIDRecord],
+        uid_record: UIDRecord,
+        synapse: bt.Synapse,
+        outgoing_model: BaseModel,
+        response_timeout: float,
+    ) -> Optional[utility_models.QueryResult]:
+        """
+        Query a uid, and if it hasn't answered within the usual tail latency for the task, query a second one too.
+        First good response wins. The loser is cancelled before it gets scored, so it isn't punished for losing
+        """
+        hedge_delay = miner_selector.get_latency_percentile(
+            task, cst.HEDGE_LATENCY_PERCENTILE, min_samples=cst.MIN_LATENCIES_FOR_HEDGING
+        )
+        primary_query = asyncio.create_task(
+            query_utils.query_miner_no_stream(
+                uid_record,
+                synapse,
+                outgoing_model,
+                task,
+                dendrite=self.dendrite,
+                synthetic_query=False,
+                connect_timeout=cst.ORGANIC_CONNECT_TIMEOUT,
+                response_timeout=response_timeout,
+            )
+        )
+        queries = [primary_query]
+        try:
+            if hedge_delay is None:
+                return await primary_query
+
+            done, _ = await asyncio.wait({primary_query}, timeout=hedge_delay)
+            if done:
+                return primary_query.result()
+
+            hedge_uid = self._get_uid_for_organic_query(task, queue, excluded_uids={uid_record.axon_uid})
+            hedge_uid_record = uid_records.get(hedge_uid)
+            if hedge_uid_record is None:
+                return await primary_query
+
+            bt.logging.debug(
+                f"Hedging {task} query to uid {uid_record.axon_uid} with uid {hedge_uid} after {hedge_delay:.2f}s"
+            )
+            hedge_query = asyncio.create_task(
+                query_utils.query_miner_no_stream(
+                    hedge_uid_record,
+                    synapse,
+                    outgoing_model,
+                    task,
+                    dendrite=self.dendrite,
+                    synthetic_query=False,
+                    connect_timeout=cst.ORGANIC_CONNECT_TIMEOUT,
+                    response_timeout=max(response_timeout - hedge_delay, cst.MIN_ORGANIC_ATTEMPT_SECONDS),
+                )
+            )
+            queries.append(hedge_query)
+
+            query_result = None
+            pending = set(queries)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for finished_query in done:
+                    query_result = finished_query.result()
+                    if query_result is not None and query_result.success:
+                        return query_result
+            return query_result
+        finally:
+            # The loser, or both of them if we were cancelled (client gone, failover deadline up), mustn't get scored
+            for query in queries:
+                if not query.done():
+                    query.cancel()
+
+    @staticmethod
+    def _get_uid_for_organic_query(
+        task: Task, queue: query_utils.UIDQueue, excluded_uids: Set[axon_uid] = frozenset()
+    ) -> Optional[axon_uid]:
+        """
+        Rotates through the queue for candidates, skipping excluded uids & any that failed in the last few seconds.
+        If every uid has failed recently, we'll still give one of them a go rather than fail outright
+        """
+        if cst.ORGANIC_UID_SELECTION_MODE == cst.UID_SELECTION_MODE_ROUND_ROBIN:
+            number_of_choices = 1
+        else:
+            number_of_choices = cst.UID_SELECTION_CHOICES
+
+        candidate_uids: List[axon_uid] = []
+        recently_failed_uid = None
+        for _ in range(len(queue.uid_map)):
+            uid = queue.get_uid_and_move_to_back()
+            if uid in excluded_uids:
+                continue
+            if miner_selector.recently_failed(task, uid):
+                if recently_failed_uid is None:
+                    recently_failed_uid = uid
+                continue
+            candidate_uids.append(uid)
+            if len(candidate_uids) >= number_of_choices:
+                break
+
+        if not candidate_uids:
+            return recently_failed_uid
+        return miner_selector.pick_best_uid(task, candidate_uids)
+
     @staticmethod
     def _get_percentage_of_tasks_to_score() -> float:
         """
@@ -281,8 +497,3 @@ class UidManager:
             return random.random() * 0.05 + 0.05
         else:
             return random.random() * 0.4 + 0.4
-
-    @staticmethod
-    async def _consume_generator(generator: AsyncGenerator) -> None:
-        async for _ in generator:
-            pass